@@ -14,11 +14,17 @@ is applied to the sail.
 
 import numpy as np
 from addaSeq_force_scoop import calculate_force_on_sample                      # Separate python script imported functions
-from deap import creator, base, tools, algorithms
-from Numpy_Deap_Tools import cxTwoPointCopy, mutFlipBitArr, init_grid          # Separate python script imported functions
+from deap import creator, base, tools
+from Numpy_Deap_Tools import cxTwoPointCopy, mutFlipBitArr, init_grid, init_seeded_population # Separate python script imported functions
 from time import time
 from sys import argv
 from experiment_recorder import ExpRecord
+from evolution_profiler import EvoProfiler, eaSimpleProfiled
+from evaluation_queue import EvalQueue, evaluate_tiled
+from multi_resolution import eaMultiResolution
+from memetic import MemeticRefinement
+from adaptive_precision import AdaptivePrecision
+import fourier_force
 from scoop import futures
 import scoop
 
@@ -34,7 +40,24 @@ cx_p = float(argv[-3])                                                         #
 mut_p = float(argv[-2])                                                        # Mutation probabilities 
 mut_ind_p = float(argv[-1])
 
-def eval_func(individual):
+# Optional features, set here rather than on the command line
+
+queue_db = None                                                                # Path to a shared evaluation queue database (see evaluation_queue.py), None uses SCOOP
+seed_frac = 0.0                                                                # Fraction of the initial population seeded from the best archived designs
+seed_mut_ind_p = 0.02                                                          # Independent flip probability for repeated seeds
+resolution_stages = None                                                       # (grid size, generations) coarse to fine, e.g. [(25, 30), (50, 20), (100, 10)], replaces grid_size and num_gen
+smooth_upsample = False                                                        # Smooth the grids when upsampling between stages, otherwise nearest-neighbour
+memetic_every = 0                                                              # Refine the elites by local search every this many generations, 0 disables it
+memetic_elites = 1                                                             # Number of elites to refine
+memetic_block = 1                                                              # Length / width of the flipped blocks
+memetic_batch = None                                                           # Flips evaluated per round, None uses the number of SCOOP workers
+adaptive_eps = None                                                            # (loose, full, ramp generations) ADDA -eps exponents, e.g. (2, 5, 10), None always uses ADDA's default. After the ramp offspring are solved one below full, elites at full
+precision_elites = 1                                                           # Best individuals of each generation always solved at full precision
+fitness_backend = "adda"                                                       # "adda", "fourier" (Fourier optics approximation only) or "prescreen" (Fourier ranking, best offspring solved with ADDA)
+prescreen_keep = 0.5                                                           # Fraction of the offspring solved with ADDA when prescreening
+records_path = r"C:\Users\angus\OneDrive - University of Bristol\University OneDrive\Documents\Year 4\Project\Coding\Data"
+
+def eval_func(individual, eps_= None):
     
     """
     This function calculates the force acting on a large grid, made up of many
@@ -42,7 +65,16 @@ def eval_func(individual):
     """
     
     tiled = np.tile(individual, (tile_factor, tile_factor))
-    return calculate_force_on_sample(tiled, lam_frac_=lambda_factor)
+    return calculate_force_on_sample(tiled, lam_frac_=lambda_factor, eps_=eps_)
+
+def eval_fourier(individual, eps_= None):
+    
+    """
+    Same as eval_func with the Fourier optics approximation in place of ADDA.
+    """
+    
+    tiled = np.tile(individual, (tile_factor, tile_factor))
+    return fourier_force.calculate_force_on_sample(tiled, lam_frac_=lambda_factor, tile_factor_=tile_factor)
 
 # Initialising the evolutionary algorithm
 
@@ -50,18 +82,35 @@ creator.create("FitnessMax", base.Fitness, weights=(1.0,))
 creator.create("Individual", np.ndarray, fitness=creator.FitnessMax) 
 
 toolbox = base.Toolbox()
-toolbox.register("map", futures.map)
 toolbox.register("attr_bool", np.random.choice, [True, False]) 
 toolbox.register("individual", init_grid, creator.Individual, grid_size_= grid_size)  
 toolbox.register("population", tools.initRepeat, list, toolbox.individual)
 
-toolbox.register("evaluate", eval_func)
+if fitness_backend not in ("adda", "fourier", "prescreen"):
+    raise ValueError(f"Unknown fitness backend {fitness_backend}")
+
+if fitness_backend == "fourier":                                               # Takes milliseconds, so it is not worth sending to the workers
+    toolbox.register("map", map)
+    toolbox.register("evaluate", eval_fourier)
+elif queue_db is None:
+    toolbox.register("map", futures.map)
+    toolbox.register("evaluate", eval_func)
+else:                                                                          # Evaluated by workers started with "python evaluation_queue.py worker <queue_db>"
+    toolbox.register("map", EvalQueue(queue_db).map)
+    toolbox.register("evaluate", evaluate_tiled, tile_factor_=tile_factor, lam_frac_=lambda_factor)
+
 toolbox.register("mate", cxTwoPointCopy)
 toolbox.register("mutate", mutFlipBitArr, indpb = mut_ind_p)
 toolbox.register("select", tools.selTournament, tournsize = tourn_size)
 
 if __name__ == "__main__":
-    
+
+    if resolution_stages:                                                      # The run starts at the coarsest grid size
+        grid_size = resolution_stages[0][0]
+        num_gen = sum(ngen + 1 for _, ngen in resolution_stages) - 1           # Last logbook gen, as for a single stage run, since each stage evaluates its first generation again
+        toolbox.register("individual", init_grid, creator.Individual, grid_size_= grid_size)
+        toolbox.register("population", tools.initRepeat, list, toolbox.individual) # initRepeat keeps the individual function it was given, so it is registered again
+
     # Prints out the parameters passed to the program
 
     print(
@@ -73,12 +122,22 @@ if __name__ == "__main__":
         \nCrossover Probability - {cx_p}\
         \nNumber of Generations - {num_gen}\
         \nTournament Size - {tourn_size}\
-        \nPopulation - {population_size}"
+        \nPopulation - {population_size}\
+        \nResolution Stages - {resolution_stages}"
     )
 
     s_time = time()
 
-    pop = toolbox.population(n = population_size)                              # Setting population size in deap
+    seed_names = []
+    if seed_frac > 0:                                                          # Starts from designs found in earlier runs
+        seeds = ExpRecord(records_path).best_grids(
+            int(round(seed_frac * population_size)), grid_size_= grid_size, lam_frac_= lambda_factor, tile_factor_= tile_factor
+        )
+        pop = init_seeded_population(creator.Individual, grid_size, population_size, seeds, seed_frac, seed_mut_ind_p)
+        seed_names = [name for _, name in seeds]
+        print(f"Seeded from: {seed_names}")
+    else:
+        pop = toolbox.population(n = population_size)                          # Setting population size in deap
     hof = tools.HallOfFame(1, similar=np.array_equal)                          # Gives the best individual in the population, np.array_equal returns true if two arrays are the same  
     
     def stat_func(ind):
@@ -90,29 +149,71 @@ if __name__ == "__main__":
     stats.register("min", np.min)
     stats.register("max", np.max)
 
-    final_pop, log = algorithms.eaSimple(                                      # Returns the final population and a logbook of the evolution
-        pop,                                                                   # Population – A list of individuals.
-        toolbox,                                                               # toolbox – A Toolbox that contains the evolution operators.
-        cxpb = cx_p,                                                           # cxpb – The probability of mating two individuals.
-        mutpb = mut_p,                                                         # mutpb – The probability of mutating an individual.
-        ngen = num_gen,                                                        # ngen – The number of generation.
-        stats = stats,                                                         # stats – A Statistics object that is updated inplace, optional.
-        halloffame = hof,                                                      # halloffame – A HallOfFame object that will contain the best individual, optional.
-        verbose = True,                                                        # verbose – Whether or not to log the statistics on the screen
-    )
+    profiler = EvoProfiler()                                                   # Records the time spent in each phase of every generation
+
+    precision = None
+    if adaptive_eps:                                                           # Loose solver tolerance early on and for poor candidates
+        loose_eps, full_eps, ramp_gens = adaptive_eps
+        precision = AdaptivePrecision(loose_eps, full_eps, ramp_gens, n_elites_= precision_elites)
+
+    screen = None
+    if fitness_backend == "prescreen":                                         # Only the offspring ranked best by Fourier optics are solved with ADDA
+        screen = fourier_force.FourierPrescreen(lambda_factor, tile_factor, keep_= prescreen_keep)
+
+    memetic = None
+    if memetic_every:                                                          # Fills the workers with single flips of the elites
+        memetic = MemeticRefinement(
+            memetic_every,
+            memetic_batch or getattr(scoop, "SIZE", None) or 1,
+            n_elites_= memetic_elites,
+            block_= memetic_block,
+            precision_= precision,                                             # Flips are compared against elites solved at full precision
+        )
+
+    if resolution_stages:
+        final_pop, log, profiler = eaMultiResolution(                          # Same as below, evolving at each grid size of the schedule in turn
+            pop,
+            toolbox,
+            resolution_stages,
+            cxpb = cx_p,
+            mutpb = mut_p,
+            stats = stats,
+            halloffame = hof,
+            verbose = True,
+            profiler = profiler,
+            smooth_ = smooth_upsample,
+            generation_hook = memetic,
+            precision = precision,
+            screen = screen,
+        )
+    else:
+        final_pop, log, profiler = eaSimpleProfiled(                           # Returns the final population, a logbook of the evolution and the timings
+            pop,                                                               # Population – A list of individuals.
+            toolbox,                                                           # toolbox – A Toolbox that contains the evolution operators.
+            cxpb = cx_p,                                                       # cxpb – The probability of mating two individuals.
+            mutpb = mut_p,                                                     # mutpb – The probability of mutating an individual.
+            ngen = num_gen,                                                    # ngen – The number of generation.
+            stats = stats,                                                     # stats – A Statistics object that is updated inplace, optional.
+            halloffame = hof,                                                  # halloffame – A HallOfFame object that will contain the best individual, optional.
+            verbose = True,                                                    # verbose – Whether or not to log the statistics on the screen
+            profiler = profiler,
+            generation_hook = memetic,                                         # Memetic refinement of the elites, optional.
+            precision = precision,                                             # Adaptive solver tolerance, optional.
+            screen = screen,                                                   # Fourier prescreening of the offspring, optional.
+        )
     
-    max_force = max(log.select('max'))                                         # Selects the maximum value in logbook
+    max_force = hof[0].fitness.values[0]                                       # Best force found, at the final grid size if run in stages
 
     e_time = time()
     T = e_time - s_time                                                        
 
     print("Time taken:", T,"s, which is", T/60,'mins, and', T/3600,'hours.')   # Time of process
+    print(profiler.summary())                                                  # Breakdown of the time spent in each generation
+    profiler.write_trace(f"trace{grid_size}-{int(s_time)}.json")               # Open in chrome://tracing or ui.perfetto.dev
     
     # Locates the directory for the experiment data to be sent
     
-    exp_manager = ExpRecord(
-    r"C:\Users\angus\OneDrive - University of Bristol\University OneDrive\Documents\Year 4\Project\Coding\Data"   
-)
+    exp_manager = ExpRecord(records_path)
 
     exp_manager.add_experiment(                                                # Adds the experiment with all relevant information
         hof[0],                                                                # Gives best individual to deap logbook as a .npy grid
@@ -129,6 +230,11 @@ if __name__ == "__main__":
         mut_ind_p,
         "Tournament",
         tourn_size,
+        seeds = seed_names,                                                    # Lineage of the run
+        solver_eps = getattr(hof[0], "solver_eps", None),
+        lineage = getattr(hof[0], "lineage", None),
+        lam_frac = lambda_factor,
+        tile_factor = tile_factor,
     )
 
     exp_manager.save()                                                         # Saves data to directory
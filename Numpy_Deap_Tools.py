@@ -75,6 +75,96 @@ def init_half_grid(icls, grid_size_):
     return icls(np.random.rand(grid_size_even, grid_size_even // 2) > 0.5)
 
 
+def resize_grid(grid, size):
+
+    """
+    Resizes a square grid to size x size by nearest-neighbour sampling, so
+    designs from runs with a different grid size can be reused.
+
+    Args:
+        grid (numpy 2d array): Grid to be resized
+        size (int): New length / width of the grid
+
+    Returns:
+        numpy 2d array: Resized grid
+    """
+
+    idx = np.arange(size) * len(grid) // size
+    return grid[np.ix_(idx, idx)]
+
+
+def upsample_grid(grid, factor, smooth_=False):
+
+    """
+    Upsamples a grid by an integer factor, each element becoming a
+    factor x factor block. With smooth_ the grid is instead interpolated
+    bilinearly between element centres and thresholded at 0.5, which rounds
+    off the corners of the blocks but keeps isolated elements. The
+    interpolation wraps around the edges since the grid is tiled.
+
+    Args:
+        grid (numpy 2d array): Grid to be upsampled
+        factor (int): Upsampling factor
+        smooth_ (bool, optional): Smooth the block edges. Defaults to False.
+
+    Returns:
+        numpy 2d array: Upsampled grid
+    """
+
+    if not smooth_:
+        return np.repeat(np.repeat(grid, factor, axis=0), factor, axis=1).astype(bool)
+
+    fine = np.asarray(grid, dtype=float)
+    for axis in (0, 1):
+        n = fine.shape[axis]
+        pos = (np.arange(n * factor) + 0.5) / factor - 0.5                     # Fine element centres in coarse element coordinates
+        lower = np.floor(pos).astype(int)
+        weight = np.expand_dims(pos - lower, 1 - axis)
+        fine = (1 - weight) * np.take(fine, lower % n, axis=axis) + weight * np.take(fine, (lower + 1) % n, axis=axis)
+    return fine >= 0.5
+
+
+def init_seeded_population(icls, grid_size_, n, seeds, seed_frac_, mut_indpb_):
+
+    """
+    Generates a population where a fraction of the individuals are copies of
+    archived designs and the rest are random. The first copy of each design
+    is kept as it is and further copies are mutated for diversity. Each
+    individual's lineage attribute holds the grid file it was seeded from,
+    or None. Clones made during the evolution keep it, and the lineage of the
+    best individual is recorded by ExpRecord.add_experiment.
+
+    Args:
+        icls : Object used to turn normal array into individual (provided by DEAP)
+        grid_size_ (int): Size of the grid (length / width)
+        n (int): Population size
+        seeds (list): (grid, grid file name) pairs, best first
+        seed_frac_ (float): Fraction of the population to seed
+        mut_indpb_ (float): Probability of each element of a repeated seed being flipped
+
+    Returns:
+        list: Generated population
+    """
+
+    n_seeded = min(n, int(round(seed_frac_ * n))) if seeds else 0
+    population = []
+
+    for i in range(n_seeded):
+        grid, name = seeds[i % len(seeds)]
+        ind = icls(resize_grid(np.asarray(grid, dtype=bool), grid_size_))
+        if i >= len(seeds):
+            mutFlipBitArr(ind, mut_indpb_)
+        ind.lineage = name
+        population.append(ind)
+
+    for _ in range(n - n_seeded):
+        ind = init_grid(icls, grid_size_)
+        ind.lineage = None
+        population.append(ind)
+
+    return population
+
+
 def cxSqCopy(ind1, ind2):
     
     """
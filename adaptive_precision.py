@@ -0,0 +1,103 @@
+"""
+This program controls how tightly ADDA's iterative solver converges. Early
+generations and poor candidates only need to be ranked roughly, so they are
+solved to a loose tolerance. The tolerance tightens over the run to an
+intermediate value, and only the elites and anything about to enter the hall
+of fame are solved again at full precision before they are recorded. The
+tolerance used is stored on each individual as solver_eps, alongside its
+fitness.
+
+Tolerances are given as ADDA -eps exponents: the solver stops once the
+relative residual is below 10^-eps. ADDA's default is 5.
+"""
+
+from functools import partial
+
+from deap import tools
+
+FULL_EPS = 5                                                                   # ADDA's default
+
+
+def needs_full(ind, full_):                                                    # Individuals without solver_eps were solved with ADDA's default, unless only estimated
+    if getattr(ind, "fourier_estimate", False):
+        return True
+    eps = getattr(ind, "solver_eps", None)
+    return eps is not None and eps < full_
+
+
+class AdaptivePrecision:
+
+    # Evaluates individuals for eaSimpleProfiled at a tolerance scheduled by generation and rank.
+
+    def __init__(self, loose_=2, full_=FULL_EPS, ramp_=10, n_elites_=1, late_=None):
+
+        """
+        Args:
+            loose_ (float, optional): Tolerance exponent at generation 0
+            full_ (float, optional): Tolerance exponent for the elites and hall of fame candidates
+            ramp_ (int, optional): Generations over which the tolerance tightens linearly from loose_ to late_
+            n_elites_ (int, optional): Number of best individuals in the population always kept at full precision
+            late_ (float, optional): Tolerance exponent once the ramp is over. Defaults to one below full_.
+        """
+
+        self.loose = loose_
+        self.full = full_
+        self.ramp = ramp_
+        self.n_elites = n_elites_
+        self.late = max(loose_, full_ - 1) if late_ is None else late_
+
+    def eps_for(self, gen):                                                    # Scheduled tolerance exponent for the offspring, rounded to half steps
+        if gen >= self.ramp:
+            return self.late
+        eps = self.loose + (self.late - self.loose) * gen / self.ramp
+        return round(eps * 2) / 2
+
+    def _evaluate(self, individuals, eps, toolbox, profiler):
+        fitnesses = profiler.map(toolbox.map, partial(toolbox.evaluate, eps_=eps), individuals)
+        for ind, fit in zip(individuals, fitnesses):
+            ind.fitness.values = fit
+            ind.solver_eps = eps
+            ind.fourier_estimate = False
+
+    def _candidates(self, population, halloffame):                             # Elites and individuals that the hall of fame update would take, estimated or not
+        candidates = tools.selBest(population, self.n_elites)
+        if halloffame is not None:
+            candidates += tools.selBest(population, halloffame.maxsize - len(halloffame))
+            if len(halloffame) > 0:
+                candidates += [ind for ind in population if ind.fitness > halloffame[-1].fitness]
+        return candidates
+
+    def evaluate(self, gen, population, invalid_ind, halloffame, toolbox, profiler):
+
+        """
+        Evaluates the invalid individuals at the scheduled tolerance, then
+        solves again at full precision the elites of the population and any
+        individual good enough to enter the hall of fame. This is repeated
+        until the elites are all at full precision, as their rank can change
+        once they are solved properly.
+
+        Args:
+            gen (int): Generation number
+            population (list): Individuals of this generation, including invalid_ind
+            invalid_ind (list): Individuals without a fitness
+            halloffame (optional): HallOfFame that will be updated with population
+            toolbox : A Toolbox whose evaluate accepts eps_
+            profiler (EvoProfiler): Profiler the evaluations are recorded in
+
+        Returns:
+            int: Number of evaluations made
+        """
+
+        if invalid_ind:
+            self._evaluate(invalid_ind, self.eps_for(gen), toolbox, profiler)
+        nevals = len(invalid_ind)
+
+        while True:
+            resolve = []
+            for ind in self._candidates(population, halloffame):
+                if needs_full(ind, self.full) and not any(ind is r for r in resolve):
+                    resolve.append(ind)
+            if not resolve:
+                return nevals
+            self._evaluate(resolve, self.full, toolbox, profiler)
+            nevals += len(resolve)
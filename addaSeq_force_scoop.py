@@ -15,19 +15,28 @@ be passed to the DEAP program to act as a fitness of an individual.
 
 import subprocess
 import os
+import socket
 import numpy as np
 from time import process_time
 from random import uniform
 import math
-import scoop
+import adda_library
 
 # https://github.com/adda-team/adda/blob/master/src/CalculateE.c (617) to make fileIO redundant if wanted tor rewrite
+# adda_library.py does this when ADDA is built as a shared library, and calculate_force_on_sample uses it if it is available
+
+# Input parameters, shared with fourier_force so the approximation models the same sail
+
+WAVELENGTH = 350                                                               # In micrometers
+REAL_REF_INDEX = 5                                                             # Real part of refractive index
+IM_REF_INDEX = 3                                                               # Imaginary part of refractive index
+LAYERS = 4                                                                     # Dipole layers the grid is extruded to
 
 class AddaException(Exception):
     pass
 
 
-def run_adda_force(dipole_per_lambda, shape_file, output_dir_name, working_directory, wavelength, real_ref_index, im_ref_index): #used in function below 'calculate_force_on_sample'
+def run_adda_force(dipole_per_lambda, shape_file, output_dir_name, working_directory, wavelength, real_ref_index, im_ref_index, eps=None, max_iter=None): #used in function below 'calculate_force_on_sample'
     
     """
     Runs the ADDA program, using a subprocess, formatted with the correct
@@ -39,6 +48,8 @@ def run_adda_force(dipole_per_lambda, shape_file, output_dir_name, working_direc
         output_dir_name (string): Name of the folder for Adda to store results.
         working_directory (string): Directory path for adda to work in/store temporary results
         wavelength (float): wavelength of incoming radiation in micrometers
+        eps (float, optional): Solver stopping criterion, the residual must reach 10^-eps. Defaults to ADDA's 5.
+        max_iter (int, optional): Maximum number of solver iterations. Defaults to ADDA's own limit.
 
     Raises:
         AddaException: Custom exception raised if there is a problem encountered running Adda
@@ -51,6 +62,12 @@ def run_adda_force(dipole_per_lambda, shape_file, output_dir_name, working_direc
     os.chdir(working_directory)
     wd = os.getcwd()                                                           # Current working directory where ADDA is 
 
+    solver_args = []                                                           # Only passed when set, so ADDA's defaults are used otherwise
+    if eps is not None:
+        solver_args += ["-eps", str(eps)]
+    if max_iter is not None:
+        solver_args += ["-iter", str(max_iter)]
+
     process = subprocess.Popen(                                                # Passes arguments as a sequence to be used in the ADDA program
         [
             "adda",                                                            # ADDA program name    
@@ -67,7 +84,7 @@ def run_adda_force(dipole_per_lambda, shape_file, output_dir_name, working_direc
             shape_file,                                                        # The binary input shape file
             "-dir",
             output_dir_name,                                                   # Where info is stored
-        ],
+        ] + solver_args,
         stdout=subprocess.PIPE,                                                # Ensures that the output is given to the mother process(here)
         stderr=subprocess.PIPE,                                                # Passes the error to the mother function (ie from ADDA to this program)
         )
@@ -101,7 +118,7 @@ def gen_shape_file(shape_arr, path_to_wd, identifier):
     with open(file_path, "w") as shape_file:                                   # Opens the shape boolean file to write 
         for ix, iy in np.ndindex(shape_arr.shape):                             # Returns list of all possible index values of the shape_arr
             if shape_arr[ix, iy]:
-                for k in range(4):                                             # Add entries for all three components x,y,z, where z goes up to the number of dipoles in the range
+                for k in range(LAYERS):                                        # Add entries for all three components x,y,z, where z goes up to the number of dipoles in the range
                     print(ix, iy, k, file=shape_file)                          # Prints the x y z coordinates of the dipoles in the shape_file 
 
     return file_path
@@ -134,12 +151,29 @@ def read_force(results_dir):
         raw = next(force_py_file)
         fpy_x, fpy_y, fpy_z = raw.split("=")[1].strip()[1:-1].split(",")
         fpy_x, fpy_y, fpy_z = float(fpy_x), float(fpy_y), float(fpy_z)
-        
-    F_x = (fpx_x + fpy_x)/8*math.pi                                            # Equation 66 in ADDA manual states that F=C_pr/8*pi (assuming normalised E-field and in a vacuum)
-    F_y = (fpx_y + fpy_y)/8*math.pi
-    F_z = (fpx_z + fpy_z)/8*math.pi 
 
-    return math.sqrt(F_x**2 + F_y**2 + F_z**2)        
+    return force_from_cross_sections((fpx_x, fpx_y, fpx_z), (fpy_x, fpy_y, fpy_z))
+
+
+def force_from_cross_sections(cpr_x, cpr_y):
+
+    """
+    Combines the radiation pressure cross sections for X and Y polarised
+    light into the magnitude of the force.
+
+    Args:
+        cpr_x (sequence): Cpr vector for X polarised light
+        cpr_y (sequence): Cpr vector for Y polarised light
+
+    Returns:
+        float: component magnitude
+    """
+
+    F_x = (cpr_x[0] + cpr_y[0])/8*math.pi                                      # Equation 66 in ADDA manual states that F=C_pr/8*pi (assuming normalised E-field and in a vacuum)
+    F_y = (cpr_x[1] + cpr_y[1])/8*math.pi
+    F_z = (cpr_x[2] + cpr_y[2])/8*math.pi
+
+    return math.sqrt(F_x**2 + F_y**2 + F_z**2)
 
 
 def calculate_force_on_sample(
@@ -148,6 +182,9 @@ def calculate_force_on_sample(
     working_directory_= r"C:\Users\angus\OneDrive - University of Bristol\University OneDrive\Documents\Year 4\Project\Coding\ADDA\adda-1.4.0_Compiled\win64", 
     del_files_= True,
     scoop_= False,
+    eps_= None,
+    max_iter_= None,
+    use_library_= True,
     ):
     
     """
@@ -157,22 +194,41 @@ def calculate_force_on_sample(
         shape_arr (numpy 2d array): Grid of dipoles representing shape read from external file
         working_directory_ (str, optional): Where ADDA should run with temporary files.
         del_files_ (bool, optional): Flag for adda to remove files after running. Defaults to True.
-        scoop_ (bool, optional): Flag to enable scoop multiprocessing. Defaults to True.
+        scoop_ (bool, optional): Flag to enable scoop multiprocessing. No longer changes the file names. Defaults to False.
+        eps_ (float, optional): Solver tolerance exponent passed to ADDA's -eps. Defaults to ADDA's 5.
+        max_iter_ (int, optional): Solver iteration limit passed to ADDA's -iter.
+        use_library_ (bool, optional): Call ADDA in-process through adda_library if it is available. Defaults to True.
 
     Returns:
         float : Radiation force produced
     """
 
-    # Input parameters
-    
-    wavelength = 350                                                           # In micrometers
-    real_ref_index = 5                                                         # Real part of refractive index 
-    im_ref_index = 3                                                           # Imaginary part of refractive index
+    wavelength = WAVELENGTH
+    real_ref_index = REAL_REF_INDEX
+    im_ref_index = IM_REF_INDEX
     dipole_per_lambda = lam_frac_ * len(
         shape_arr
         )                                                                      # Fixes grid to be 1/lam_frac_ wavelengths wide
-    experiment_identifier = 1 if not scoop_ else scoop.worker.decode("utf-8")
-    experiment_identifier = experiment_identifier[-1]
+
+    if use_library_ and adda_library.available():                              # No process, shape file or result files
+        try:
+            cpr_x, cpr_y = adda_library.solve(
+                shape_arr,
+                LAYERS,                                                        # Same depth as gen_shape_file
+                dipole_per_lambda,
+                wavelength,
+                real_ref_index,
+                im_ref_index,
+                eps=eps_,
+                max_iter=max_iter_,
+            )
+        except adda_library.AddaLibraryError as e:
+            raise AddaException(str(e)) from e
+        return (force_from_cross_sections(cpr_x, cpr_y),)
+
+    experiment_identifier = (
+        f"{socket.gethostname()}-{os.getpid()}"
+        )                                                                      # Host and process id keep files apart when processes on several nodes share the working directory
     shape_path = gen_shape_file(shape_arr, working_directory_, experiment_identifier) # Path to dipole shape storage
 
     result_path = run_adda_force(
@@ -182,7 +238,9 @@ def calculate_force_on_sample(
         working_directory_,
         wavelength,
         real_ref_index,
-        im_ref_index
+        im_ref_index,
+        eps=eps_,
+        max_iter=max_iter_,
     )
 
     force = read_force(result_path)
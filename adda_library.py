@@ -0,0 +1,169 @@
+"""
+This program calls ADDA in-process through ctypes, for when ADDA has been
+built as a shared library. It avoids starting a process, writing the shape
+file and reading the results for every evaluation, and ADDA keeps its solver
+state and FFT plans between calls as long as the parameters do not change.
+
+ADDA does not ship as a library, so this expects it to be compiled with a
+small wrapper around the code in CalculateE.c that exports:
+
+    int adda_setup(int argc, char **argv);
+        Parses an ADDA command line (-lambda, -dpl, -m, -eps, -iter, ...)
+        and prepares the solver. Returns 0 on success.
+    int adda_solve(const unsigned char *occupancy, int nx, int ny, int nz,
+                   double *cpr_x, double *cpr_y);
+        Solves for a C-ordered nx * ny occupancy grid extruded nz dipoles
+        deep, writing the Cpr vectors for X and Y polarised light into the
+        two arrays of length 3. Returns 0 on success.
+    void adda_finalize(void);
+        Frees the solver state.
+    const char *adda_last_error(void);
+        Message describing the last failure.
+
+The library is found from the ADDA_LIBRARY environment variable, or as
+"adda" on the usual library path. If it cannot be loaded, available() returns
+False and calculate_force_on_sample falls back to running the executable.
+
+adda_stub.c implements this interface with the made-up cross sections of
+fake_adda.py, as a template for the wrapper and for check_adda_library.py.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import threading
+
+import numpy as np
+
+
+class AddaLibraryError(Exception):
+    pass
+
+
+_lib = None
+_load_failed = False
+_config = None                                                                 # Command line the solver is currently set up with
+_lock = threading.Lock()                                                       # ADDA keeps global state, so one call at a time per process
+
+
+def _load():                                                                   # Loads the library once per process, returns None if it is not there
+    global _lib, _load_failed
+    if _lib is not None or _load_failed:
+        return _lib
+
+    path = os.environ.get("ADDA_LIBRARY") or ctypes.util.find_library("adda")
+    try:
+        if path is None:
+            raise OSError("ADDA library not found")
+        lib = ctypes.CDLL(path)
+        lib.adda_setup.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_char_p)]
+        lib.adda_setup.restype = ctypes.c_int
+        lib.adda_solve.argtypes = [
+            ctypes.POINTER(ctypes.c_ubyte),
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.POINTER(ctypes.c_double),
+            ctypes.POINTER(ctypes.c_double),
+        ]
+        lib.adda_solve.restype = ctypes.c_int
+        lib.adda_finalize.argtypes = []
+        lib.adda_finalize.restype = None
+        lib.adda_last_error.argtypes = []
+        lib.adda_last_error.restype = ctypes.c_char_p
+    except (OSError, AttributeError):                                         # Missing library or missing symbols
+        _load_failed = True
+        return None
+
+    _lib = lib
+    return _lib
+
+
+def available():
+    return _load() is not None
+
+
+def _error(lib, what):
+    message = lib.adda_last_error()
+    return AddaLibraryError(f"{what} failed: {message.decode('utf-8') if message else 'unknown error'}")
+
+
+def _setup(lib, args):                                                         # Sets the solver up again only if the command line has changed
+    global _config
+    if args == _config:
+        return
+    if _config is not None:
+        lib.adda_finalize()
+        _config = None
+    argv = (ctypes.c_char_p * len(args))(*[a.encode("utf-8") for a in args])
+    if lib.adda_setup(len(args), argv) != 0:
+        raise _error(lib, "adda_setup")
+    _config = args
+
+
+def solve(shape_arr, depth, dipole_per_lambda, wavelength, real_ref_index, im_ref_index, eps=None, max_iter=None):
+
+    """
+    Calculates the radiation pressure cross sections of a grid of dipoles.
+    Boolean and uint8 C-contiguous grids are passed to ADDA without copying.
+
+    Args:
+        shape_arr (numpy 2d array): Grid of dipoles, True where there is material
+        depth (int): Number of dipole layers the grid is extruded to
+        dipole_per_lambda (float): Dipoles per lambda parameter
+        wavelength (float): wavelength of incoming radiation in micrometers
+        real_ref_index (float): Real part of refractive index
+        im_ref_index (float): Imaginary part of refractive index
+        eps (float, optional): Solver tolerance exponent, as ADDA's -eps
+        max_iter (int, optional): Solver iteration limit, as ADDA's -iter
+
+    Raises:
+        AddaLibraryError: If the library is not available or ADDA fails
+
+    Returns:
+        tuple: Cpr vectors (numpy arrays) for X and Y polarised light
+    """
+
+    lib = _load()
+    if lib is None:
+        raise AddaLibraryError("ADDA library not available")
+
+    args = [
+        "adda",
+        "-Cpr",
+        "-lambda",
+        str(wavelength),
+        "-dpl",
+        str(dipole_per_lambda),
+        "-m",
+        str(real_ref_index),
+        str(im_ref_index),
+        "-grid",                                                               # Part of the configuration so plans are rebuilt when the grid changes
+        str(shape_arr.shape[0]),
+        str(shape_arr.shape[1]),
+        str(depth),
+    ]
+    if eps is not None:
+        args += ["-eps", str(eps)]
+    if max_iter is not None:
+        args += ["-iter", str(max_iter)]
+
+    occupancy = np.ascontiguousarray(shape_arr)
+    occupancy = occupancy.view(np.uint8) if occupancy.dtype in (np.bool_, np.uint8) else occupancy.astype(np.uint8)
+    cpr_x = np.empty(3)
+    cpr_y = np.empty(3)
+
+    with _lock:
+        _setup(lib, args)
+        status = lib.adda_solve(
+            occupancy.ctypes.data_as(ctypes.POINTER(ctypes.c_ubyte)),
+            shape_arr.shape[0],
+            shape_arr.shape[1],
+            depth,
+            cpr_x.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+            cpr_y.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        )
+        if status != 0:
+            raise _error(lib, "adda_solve")
+
+    return cpr_x, cpr_y
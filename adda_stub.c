@@ -0,0 +1,121 @@
+/*
+ * Stand-in for ADDA built as a shared library, with the interface that
+ * adda_library.py expects. It makes up the same cross sections as
+ * fake_adda.py, so the in-process and executable paths can be checked
+ * against each other without ADDA. The real library is ADDA's sources
+ * compiled with a wrapper exporting these four functions around the code
+ * in CalculateE.c; this file is the template for that wrapper.
+ *
+ * Build:
+ *
+ *     cc -shared -fPIC -O2 -o libadda_stub.so adda_stub.c
+ *     export ADDA_LIBRARY=$PWD/libadda_stub.so
+ *
+ * check_adda_library.py builds it and runs the checks.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+static char last_error[256] = "";
+static int configured = 0;
+static int setup_count = 0;                   /* Lets the checks see when the solver is set up again */
+static double wavelength, dipole_per_lambda;
+static int grid_nx, grid_ny, grid_nz;
+
+static int fail(const char *message)
+{
+    snprintf(last_error, sizeof(last_error), "%s", message);
+    return 1;
+}
+
+int adda_setup(int argc, char **argv)
+{
+    int i;
+
+    wavelength = dipole_per_lambda = 0;
+    grid_nx = grid_ny = grid_nz = 0;
+    for (i = 1; i < argc; i++) {               /* Only the options needed here, the rest are accepted and ignored */
+        if (strcmp(argv[i], "-lambda") == 0 && i + 1 < argc)
+            wavelength = atof(argv[++i]);
+        else if (strcmp(argv[i], "-dpl") == 0 && i + 1 < argc)
+            dipole_per_lambda = atof(argv[++i]);
+        else if (strcmp(argv[i], "-grid") == 0 && i + 3 < argc) {
+            grid_nx = atoi(argv[++i]);
+            grid_ny = atoi(argv[++i]);
+            grid_nz = atoi(argv[++i]);
+        }
+    }
+    if (wavelength <= 0 || dipole_per_lambda <= 0)
+        return fail("-lambda and -dpl must be positive");
+    if (grid_nx <= 0 || grid_ny <= 0 || grid_nz <= 0)
+        return fail("-grid must be given with three positive sizes");
+
+    configured = 1;
+    setup_count++;
+    return 0;
+}
+
+int adda_solve(const unsigned char *occupancy, int nx, int ny, int nz, double *cpr_x, double *cpr_y)
+{
+    int i, j, n = 0, max_i = -1, max_j = -1, edges = 0, x_bias = 0, y_bias = 0;
+    double d, area, edge_frac, size;
+
+    if (!configured)
+        return fail("adda_solve called before adda_setup");
+    if (nx != grid_nx || ny != grid_ny || nz != grid_nz)
+        return fail("grid does not match the one given to adda_setup");
+
+    for (i = 0; i < nx; i++)
+        for (j = 0; j < ny; j++)
+            if (occupancy[i * ny + j]) {
+                n++;
+                if (i > max_i) max_i = i;
+                if (j > max_j) max_j = j;
+            }
+
+    memset(cpr_x, 0, 3 * sizeof(double));
+    memset(cpr_y, 0, 3 * sizeof(double));
+    if (n == 0)
+        return 0;
+
+    /* As fake_adda.py, which only sees the occupied cells, so the grid ends at the last of them */
+    nx = max_i + 1;
+    ny = max_j + 1;
+    for (i = 0; i < nx; i++)
+        for (j = 0; j < ny; j++) {
+            int cell = occupancy[i * grid_ny + j] != 0;
+            if (i + 1 < nx && cell != (occupancy[(i + 1) * grid_ny + j] != 0)) edges++;
+            if (j + 1 < ny && cell != (occupancy[i * grid_ny + j + 1] != 0)) edges++;
+            if (cell) {
+                x_bias += i < nx / 2 ? 1 : -1;
+                y_bias += j < ny / 2 ? 1 : -1;
+            }
+        }
+
+    d = wavelength / dipole_per_lambda;
+    area = n * d * d;
+    size = (double)nx * ny;
+    edge_frac = edges / (2 * size);
+
+    cpr_x[0] = cpr_y[1] = area * 0.1 * x_bias / size;
+    cpr_x[1] = cpr_y[0] = area * 0.1 * y_bias / size;
+    cpr_x[2] = cpr_y[2] = area * (1 + edge_frac);
+    return 0;
+}
+
+void adda_finalize(void)
+{
+    configured = 0;
+}
+
+const char *adda_last_error(void)
+{
+    return last_error;
+}
+
+int adda_stub_setup_count(void)
+{
+    return setup_count;
+}
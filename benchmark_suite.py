@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This program benchmarks the hot paths of the optimisation: writing the shape
+file, reading the forces, the mutation and crossover operators, tiling the
+individual, recording an experiment and the whole ADDA evaluation as seen by
+the orchestrator. ADDA is replaced by fake_adda.py, so everything runs on a
+laptop.
+
+Results are written as JSON so runs on different commits can be compared:
+
+    python benchmark_suite.py -o before.json
+    (change something)
+    python benchmark_suite.py -o after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import stat
+import subprocess
+import sys
+import tempfile
+from multiprocessing import Pool
+from statistics import median
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+import fake_adda
+from addaSeq_force_scoop import calculate_force_on_sample, gen_shape_file, read_force
+from experiment_recorder import ExpRecord
+from Numpy_Deap_Tools import cxSqCopy, cxTwoPointCopy, mutFlipBitArr
+
+GRID_SIZES = [10, 25, 50, 100, 200]
+TILE_FACTORS = [1, 2, 5, 10]
+WORKER_COUNTS = [1, 2, 4]
+LAM_FRAC = 0.1
+
+
+def time_call(func, min_time=0.2, max_repeat=20):
+
+    """
+    Calls func repeatedly until min_time has passed or max_repeat calls have
+    been made, always at least once.
+
+    Args:
+        func (function): Function taking no arguments
+        min_time (float, optional): Time to spend on the benchmark in seconds
+        max_repeat (int, optional): Largest number of calls
+
+    Returns:
+        list: Time of each call in seconds
+    """
+
+    times = []
+    while not times or (sum(times) < min_time and len(times) < max_repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return times
+
+
+def make_result(name, params, times, **extra):
+    result = {
+        "name": name,
+        "params": params,
+        "repeats": len(times),
+        "min": min(times),
+        "median": median(times),
+        "mean": sum(times) / len(times),
+    }
+    result.update(extra)
+    return result
+
+
+def random_grid(n):
+    return np.random.rand(n, n) > 0.5
+
+
+def install_fake_adda(bin_dir):                                                # Puts an executable called "adda" running fake_adda.py on the PATH
+    script = os.path.abspath(fake_adda.__file__)
+    exe = os.path.join(bin_dir, "adda")
+    with open(exe, "w") as f:
+        f.write(f"#!/bin/sh\nexec \"{sys.executable}\" \"{script}\" \"$@\"\n")         # Same interpreter as the suite, so numpy is there
+    os.chmod(exe, os.stat(exe).st_mode | stat.S_IEXEC)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+
+
+def bench_operators(grid_sizes, tile_factors, tmp, min_time):
+    results = []
+
+    for n in grid_sizes:
+        grid = random_grid(n)
+
+        times = time_call(lambda: mutFlipBitArr(grid.copy(), 0.05), min_time)
+        results.append(make_result("mutFlipBitArr", {"grid_size": n}, times))
+
+        ind1, ind2 = random_grid(n), random_grid(n)
+        times = time_call(lambda: cxSqCopy(ind1, ind2), min_time)
+        results.append(make_result("cxSqCopy", {"grid_size": n}, times))
+
+        times = time_call(lambda: cxTwoPointCopy(ind1, ind2), min_time)
+        results.append(make_result("cxTwoPointCopy", {"grid_size": n}, times))
+
+        for t in tile_factors:
+            params = {"grid_size": n, "tile_factor": t}
+
+            times = time_call(lambda: np.tile(grid, (t, t)), min_time)
+            results.append(make_result("tile", params, times))
+
+            tiled = np.tile(grid, (t, t))
+            times = time_call(lambda: gen_shape_file(tiled, tmp, "bench"), min_time)
+            results.append(make_result("gen_shape_file", params, times))
+
+    return results
+
+
+def bench_read_force(tmp, min_time):
+    results_dir = os.path.join(tmp, "read_force")
+    fake_adda.write_cross_sections(results_dir, {"X": (0.1, 0.2, 3.0), "Y": (0.2, 0.1, 3.0)})
+    times = time_call(lambda: read_force(results_dir), min_time)
+    return [make_result("read_force", {}, times)]
+
+
+def bench_add_experiment(grid_sizes, tmp, min_time):
+    records = os.path.join(tmp, "records")
+    os.makedirs(records, exist_ok=True)
+    columns = [
+        "Date", "Grid Size", "Force", "Direction", "Number of Generations", "Population",
+        "Cross Over Prob", "Cross Over Method", "Cross Over Parameter", "Mutation Probability",
+        "Mutation Method", "Mutation Parameter", "Selection Method", "Selection Parameter",
+        "Grid File Name", "Log File name",
+    ]
+    pd.DataFrame(columns=columns).to_csv(os.path.join(records, "ExperimentData.csv"), index=False)
+
+    results = []
+    exp_manager = ExpRecord(records)
+    log = [{"gen": g, "max": 1.0} for g in range(100)]
+    for n in grid_sizes:
+        grid = random_grid(n)
+        times = time_call(
+            lambda: exp_manager.add_experiment(
+                grid, log, 1.0, 0, 100, 50, 0.5, "TwoPoint", None, 0.5, "FlipBit", 0.05, "Tournament", 3
+            ),
+            min_time,
+        )
+        results.append(make_result("ExpRecord.add_experiment", {"grid_size": n}, times))
+    return results
+
+
+def _evaluate(args):                                                           # Module level so multiprocessing can pickle it
+    grid, tile_factor, working_directory = args
+    return calculate_force_on_sample(
+        np.tile(grid, (tile_factor, tile_factor)),
+        lam_frac_=LAM_FRAC,
+        working_directory_=working_directory,
+        use_library_=False,                                                    # Always measures the subprocess path against the fake ADDA
+    )
+
+
+def bench_end_to_end(grid_sizes, tile_factors, worker_counts, tmp, delay, n_evals):
+
+    """
+    Times calculate_force_on_sample against the fake ADDA. The overhead is the
+    time per evaluation beyond the fake solver delay, i.e. shape file writing,
+    process start-up, result parsing and clean-up. The scaling runs evaluate
+    n_evals grids over a pool of workers sharing one working directory.
+    """
+
+    os.environ["FAKE_ADDA_DELAY"] = str(delay)
+    work = os.path.join(tmp, "adda_wd")
+    os.makedirs(work, exist_ok=True)
+
+    results = []
+    for n in grid_sizes:
+        for t in tile_factors:
+            grid = random_grid(n)
+            times = time_call(lambda: _evaluate((grid, t, work)), min_time=0, max_repeat=3)
+            results.append(
+                make_result(
+                    "evaluation",
+                    {"grid_size": n, "tile_factor": t, "delay": delay},
+                    times,
+                    overhead=median(times) - delay,
+                )
+            )
+
+    n, t = grid_sizes[0], tile_factors[0]
+    jobs = [(random_grid(n), t, work) for _ in range(n_evals)]
+    for workers in worker_counts:
+        with Pool(workers) as pool:
+            start = perf_counter()
+            pool.map(_evaluate, jobs, chunksize=1)
+            wall = perf_counter() - start
+        results.append(
+            make_result(
+                "evaluation_scaling",
+                {"grid_size": n, "tile_factor": t, "delay": delay, "workers": workers, "n_evals": n_evals},
+                [wall],
+                throughput=n_evals / wall,
+                efficiency=n_evals * delay / (wall * workers),
+            )
+        )
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(old, new):
+
+    """
+    Prints the ratio of the median times of matching benchmarks, new / old.
+    Values below 1 are speed ups.
+    """
+
+    def key(r):
+        return r["name"], json.dumps(r["params"], sort_keys=True)
+
+    old_results = {key(r): r for r in old["results"]}
+    print(f"Comparing {new.get('commit')} against {old.get('commit')}")
+    for r in new["results"]:
+        o = old_results.get(key(r))
+        if o is None:
+            continue
+        ratio = r["median"] / o["median"] if o["median"] else float("nan")
+        print(f"{r['name']:>26} {json.dumps(r['params']):<60} {o['median']:.3e} -> {r['median']:.3e}  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", default="bench_output.json", help="JSON file for the results")
+    parser.add_argument("--compare", help="Earlier results JSON file to compare against")
+    parser.add_argument("--grid-sizes", type=int, nargs="+", default=GRID_SIZES)
+    parser.add_argument("--tile-factors", type=int, nargs="+", default=TILE_FACTORS)
+    parser.add_argument("--workers", type=int, nargs="+", default=WORKER_COUNTS)
+    parser.add_argument("--delay", type=float, default=0.05, help="Fake ADDA solve time in seconds")
+    parser.add_argument("--n-evals", type=int, default=16, help="Evaluations per worker scaling run")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Time to spend on each micro benchmark")
+    parser.add_argument("--skip-e2e", action="store_true", help="Skip the fake ADDA evaluations")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = bench_operators(args.grid_sizes, args.tile_factors, tmp, args.min_time)
+        results += bench_read_force(tmp, args.min_time)
+        results += bench_add_experiment(args.grid_sizes, tmp, args.min_time)
+        if not args.skip_e2e:
+            bin_dir = os.path.join(tmp, "bin")
+            os.makedirs(bin_dir)
+            install_fake_adda(bin_dir)
+            results += bench_end_to_end(
+                args.grid_sizes, args.tile_factors, args.workers, tmp, args.delay, args.n_evals
+            )
+
+    output = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=1)
+
+    for r in results:
+        print(f"{r['name']:>26} {json.dumps(r['params']):<60} median {r['median']:.3e} s")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This program checks adda_library against the stub library in adda_stub.c: the
+cross sections returned by solve, that the solver is only set up again when
+its configuration changes, that a bad configuration is reported, and that
+calculate_force_on_sample falls back to the executable when the library
+cannot be loaded. The stub makes up the same cross sections as fake_adda.py,
+so both paths of calculate_force_on_sample must give the same force.
+
+    python check_adda_library.py
+
+The stub is built with the C compiler from the CC environment variable
+(default cc) unless ADDA_LIBRARY already points at a build of it.
+"""
+
+import ctypes
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+import adda_library
+import fake_adda
+from addaSeq_force_scoop import (
+    IM_REF_INDEX,
+    LAYERS,
+    REAL_REF_INDEX,
+    WAVELENGTH,
+    AddaException,
+    calculate_force_on_sample,
+    gen_shape_file,
+)
+from benchmark_suite import install_fake_adda
+
+REF_INDEX = (REAL_REF_INDEX, IM_REF_INDEX)
+DEPTH = LAYERS
+LAM_FRAC = 0.1
+
+
+def build_stub(out_dir):                                                       # Returns the path of the compiled stub library
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "adda_stub.c")
+    path = os.path.join(out_dir, "libadda_stub.so")
+    subprocess.run(
+        [os.environ.get("CC", "cc"), "-shared", "-fPIC", "-O2", "-o", path, source], check=True
+    )
+    return path
+
+
+def reload_library(path):                                                      # Forgets the library loaded so far, as in a new process
+    if adda_library._lib is not None and adda_library._config is not None:
+        adda_library._lib.adda_finalize()
+    adda_library._lib = None
+    adda_library._load_failed = False
+    adda_library._config = None
+    os.environ["ADDA_LIBRARY"] = path
+
+
+def setup_count():
+    return adda_library._lib.adda_stub_setup_count()
+
+
+def expected_cross_sections(grid, tmp):                                        # What fake_adda makes of the shape file for the grid
+    shape_path = gen_shape_file(grid, tmp, "check")
+    coords = fake_adda.read_shape(shape_path)
+    return fake_adda.fake_cross_sections(coords, WAVELENGTH, LAM_FRAC * len(grid))
+
+
+def check_solve(tmp):
+    for n in (1, 7, 20):
+        grid = np.random.rand(n, n) > 0.5
+        grid[0, 0] = True                                                      # fake_adda cannot read an empty shape file
+        cpr_x, cpr_y = adda_library.solve(grid, DEPTH, LAM_FRAC * n, WAVELENGTH, *REF_INDEX)
+        exp_x, exp_y = expected_cross_sections(grid, tmp)
+        assert np.allclose(cpr_x, exp_x) and np.allclose(cpr_y, exp_y), f"cross sections differ for grid size {n}"
+
+    cpr_x, cpr_y = adda_library.solve(np.zeros((5, 5), dtype=bool), DEPTH, LAM_FRAC * 5, WAVELENGTH, *REF_INDEX)
+    assert not cpr_x.any() and not cpr_y.any(), "an empty grid must give no force"
+
+    grid = np.random.rand(6, 6) > 0.5
+    as_bool = adda_library.solve(grid, DEPTH, 0.6, WAVELENGTH, *REF_INDEX)
+    as_int = adda_library.solve(grid.astype(int), DEPTH, 0.6, WAVELENGTH, *REF_INDEX)
+    assert np.allclose(as_bool, as_int), "boolean and integer grids must give the same result"
+
+
+def check_setup_caching():
+    grid = np.random.rand(8, 8) > 0.5
+    adda_library.solve(grid, DEPTH, 0.8, WAVELENGTH, *REF_INDEX)
+    before = setup_count()
+
+    adda_library.solve(grid, DEPTH, 0.8, WAVELENGTH, *REF_INDEX)
+    adda_library.solve(~grid, DEPTH, 0.8, WAVELENGTH, *REF_INDEX)
+    assert setup_count() == before, "same configuration must reuse the solver"
+
+    adda_library.solve(grid, DEPTH, 0.8, WAVELENGTH, *REF_INDEX, eps=3)
+    assert setup_count() == before + 1, "a new tolerance must set the solver up again"
+
+    adda_library.solve(np.tile(grid, (2, 2)), DEPTH, 1.6, WAVELENGTH, *REF_INDEX, eps=3)
+    assert setup_count() == before + 2, "a new grid size must set the solver up again"
+
+
+def check_setup_error():
+    try:
+        adda_library._setup(adda_library._lib, ["adda", "-lambda", str(WAVELENGTH)]) # No -dpl or -grid
+    except adda_library.AddaLibraryError as e:
+        assert "-dpl" in str(e), f"unexpected message: {e}"
+    else:
+        raise AssertionError("a bad configuration must raise AddaLibraryError")
+    assert adda_library._config is None, "a failed setup must not be cached"
+
+
+def check_fallback(tmp):
+    work = os.path.join(tmp, "adda_wd")
+    os.makedirs(work, exist_ok=True)
+    grid = np.random.rand(10, 10) > 0.5
+    grid[0, 0] = True
+
+    from_library = calculate_force_on_sample(grid, LAM_FRAC, working_directory_=work)
+    from_executable = calculate_force_on_sample(grid, LAM_FRAC, working_directory_=work, use_library_=False)
+    assert np.allclose(from_library, from_executable, rtol=1e-3), "library and executable paths disagree"
+
+    reload_library(os.path.join(tmp, "missing", "libadda.so"))
+    assert not adda_library.available(), "a missing library must not be available"
+    fallback = calculate_force_on_sample(grid, LAM_FRAC, working_directory_=work)
+    assert np.allclose(fallback, from_executable, rtol=1e-3), "fallback must run the executable"
+    assert not os.listdir(work), "the executable path must clean up after itself"
+
+    try:
+        adda_library.solve(grid, DEPTH, 1.0, WAVELENGTH, *REF_INDEX)
+    except adda_library.AddaLibraryError:
+        pass
+    else:
+        raise AssertionError("solve without a library must raise AddaLibraryError")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        library = os.environ.get("ADDA_LIBRARY") or build_stub(tmp)
+        reload_library(library)
+        if not adda_library.available():
+            sys.exit(f"Could not load {library}")
+        try:
+            adda_library._lib.adda_stub_setup_count.restype = ctypes.c_int
+        except AttributeError:
+            sys.exit(f"{library} is not the stub from adda_stub.c")
+
+        bin_dir = os.path.join(tmp, "bin")
+        os.makedirs(bin_dir)
+        install_fake_adda(bin_dir)
+
+        checks = [
+            ("solve", lambda: check_solve(tmp)),
+            ("setup caching", check_setup_caching),
+            ("setup error", check_setup_error),
+            ("fallback", lambda: check_fallback(tmp)),                         # Last, as it unloads the library
+        ]
+        failed = 0
+        for name, check in checks:
+            try:
+                check()
+            except (AssertionError, AddaException, adda_library.AddaLibraryError) as e:
+                failed += 1
+                print(f"{name:>14}: FAIL {e}")
+            else:
+                print(f"{name:>14}: ok")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This program provides a durable evaluation queue, stored in an SQLite file on
+a shared filesystem, so the evaluations of a run are not tied to a single job
+allocation. The evolution driver puts grids on the queue and waits for the
+results, and any number of workers, started as separate cluster jobs,
+take evaluations off the queue:
+
+    python evaluation_queue.py worker /shared/path/queue.db
+    python evaluation_queue.py status /shared/path/queue.db
+
+A worker holds a lease on each evaluation and renews it with a heartbeat
+while ADDA runs. If a worker is preempted or dies, its lease runs out and the
+evaluation is handed to another worker, so workers can be added or removed
+while the optimisation is running. The driver likewise keeps a heartbeat on
+each batch it is waiting for; the batches of a driver that has died are
+dropped so workers do not spend time on them. A batch is named by a hash of
+its evaluations, so a restarted driver that asks for the same evaluations
+picks up the results already there.
+
+The database uses SQLite's default rollback journal rather than WAL, since
+WAL does not work on network filesystems. The filesystem must support POSIX
+file locks (most NFS and Lustre setups do).
+"""
+
+import hashlib
+import os
+import pickle
+import signal
+import sqlite3
+import threading
+from contextlib import contextmanager
+from sys import argv
+from time import sleep, time
+
+import numpy as np
+
+from addaSeq_force_scoop import calculate_force_on_sample
+from evolution_profiler import _worker_name
+
+
+class EvalQueueError(Exception):
+    pass
+
+
+def evaluate_tiled(individual, tile_factor_, lam_frac_, eps_=None):
+
+    """
+    Tiles the individual and calculates the force on it with ADDA, as eval_func
+    does in First_Evolution_scoop. Defined here so that the queue workers can
+    unpickle it without importing the driver.
+    """
+
+    tiled = np.tile(individual, (tile_factor_, tile_factor_))
+    return calculate_force_on_sample(tiled, lam_frac_=lam_frac_, eps_=eps_)
+
+
+@contextmanager
+def _transaction(conn):                                                        # Takes the write lock straight away so two workers cannot claim the same job
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:                                                # Also when COMMIT itself failed, e.g. on a busy database
+            conn.execute("ROLLBACK")
+        raise
+
+
+class EvalQueue:
+
+    # Evaluation queue stored in an SQLite database, shared by the driver and the workers.
+
+    def __init__(self, path, lease_=120, max_attempts_=3, batch_expiry_=600):
+
+        """
+        Args:
+            path (string): Path to the database file, created if it does not exist
+            lease_ (float, optional): Seconds a worker may hold an evaluation without a heartbeat
+            max_attempts_ (int, optional): Times an evaluation is tried before it is marked as failed
+            batch_expiry_ (float, optional): Seconds a batch is kept without a heartbeat from its driver
+        """
+
+        self.path = os.path.abspath(path)                                      # Workers may change directory, e.g. ADDA's working directory
+        self.lease = lease_
+        self.max_attempts = max_attempts_
+        self.batch_expiry = batch_expiry_
+        self.conn = self._connect()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_expiry REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result BLOB,
+                error TEXT,
+                submitted REAL,
+                finished REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+            CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch);
+            CREATE TABLE IF NOT EXISTS batches (
+                batch TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+            """
+        )
+
+    def _connect(self):                                                        # Autocommit mode, transactions are started explicitly
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def submit(self, payloads):
+
+        """
+        Adds pickled payloads to the queue as one batch. If a batch of the
+        same payloads is already on the queue, e.g. submitted by this driver
+        before it was restarted, that batch is reused.
+
+        Args:
+            payloads (list): Pickled (function, argument) pairs
+
+        Returns:
+            string: Identifier of the batch
+        """
+
+        digest = hashlib.sha1()
+        for p in payloads:
+            digest.update(len(p).to_bytes(8, "little"))
+            digest.update(p)
+        batch = digest.hexdigest()
+        now = time()
+        with _transaction(self.conn):
+            self._expire(self.conn)
+            cur = self.conn.execute("UPDATE batches SET heartbeat = ? WHERE batch = ?", (now, batch))
+            if cur.rowcount == 0:
+                self.conn.execute("INSERT INTO batches (batch, heartbeat) VALUES (?, ?)", (batch, now))
+                self.conn.executemany(
+                    "INSERT INTO jobs (batch, payload, submitted) VALUES (?, ?, ?)",
+                    [(batch, p, now) for p in payloads],
+                )
+        return batch
+
+    def _expire(self, conn):                                                   # Must be called inside a transaction
+        now = time()
+        conn.execute(
+            "DELETE FROM jobs WHERE batch NOT IN (SELECT batch FROM batches WHERE heartbeat >= ?)",
+            (now - self.batch_expiry,),
+        )                                                                      # Batches whose driver has gone
+        conn.execute("DELETE FROM batches WHERE heartbeat < ?", (now - self.batch_expiry,))
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired too many times' "
+            "WHERE status = 'leased' AND lease_expiry < ? AND attempts >= ?",
+            (now, self.max_attempts),
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'pending', worker = NULL "
+            "WHERE status = 'leased' AND lease_expiry < ?",
+            (now,),
+        )
+
+    def claim(self, worker, conn=None):
+
+        """
+        Leases the oldest pending evaluation to a worker. Expired leases are
+        put back on the queue and expired batches dropped first.
+
+        Args:
+            worker (string): Name of the worker
+            conn (sqlite3.Connection, optional): Connection to use, defaults to the queue's own
+
+        Returns:
+            tuple: (job id, payload), or None if the queue is empty
+        """
+
+        conn = conn or self.conn
+        with _transaction(conn):
+            self._expire(conn)
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', worker = ?, lease_expiry = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (worker, time() + self.lease, row[0]),
+                )
+        return row
+
+    def heartbeat(self, job_id, worker, conn=None):
+
+        """
+        Renews a worker's lease on an evaluation.
+
+        Returns:
+            bool: False if the worker no longer holds the lease
+        """
+
+        conn = conn or self.conn
+        with _transaction(conn):
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expiry = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time() + self.lease, job_id, worker),
+            )
+        return cur.rowcount == 1
+
+    def complete(self, job_id, result, conn=None):
+
+        """
+        Stores the result of an evaluation. A result is kept even if the lease
+        had expired in the meantime, as long as nobody else finished it first.
+        """
+
+        conn = conn or self.conn
+        with _transaction(conn):
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, finished = ?, lease_expiry = NULL "
+                "WHERE id = ? AND status != 'done'",
+                (result, time(), job_id),
+            )
+
+    def fail(self, job_id, worker, error, conn=None):
+
+        """
+        Records an error raised by an evaluation. The evaluation is put back
+        on the queue unless it has already been tried max_attempts_ times.
+        """
+
+        conn = conn or self.conn
+        with _transaction(conn):
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL, error = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (self.max_attempts, error, job_id, worker),
+            )
+
+    def release(self, job_id, worker, conn=None):                              # Hands an evaluation back without counting the attempt, e.g. on preemption
+        conn = conn or self.conn
+        with _transaction(conn):
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', worker = NULL, attempts = attempts - 1 "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (job_id, worker),
+            )
+
+    def map(self, func, iterable, poll_=1.0):
+
+        """
+        Drop-in replacement for futures.map. Each call of func on an item is
+        put on the queue and the results are returned in order once all of
+        them have been evaluated by the workers. Individuals are sent as plain
+        numpy arrays so that the workers do not need the DEAP creator classes.
+
+        Args:
+            func (function): Picklable function, importable by the workers
+            iterable : Arguments for func
+            poll_ (float, optional): Seconds between checks for results
+
+        Raises:
+            EvalQueueError: If an evaluation failed on every attempt
+
+        Returns:
+            list: Results of func
+        """
+
+        items = [i.view(np.ndarray) if isinstance(i, np.ndarray) else i for i in iterable]
+        if not items:
+            return []
+        payloads = [pickle.dumps((func, i), pickle.HIGHEST_PROTOCOL) for i in items]
+        batch = self.submit(payloads)
+
+        while True:
+            with _transaction(self.conn):
+                self._expire(self.conn)                                        # Also done here in case every worker has gone
+                alive = self.conn.execute(
+                    "UPDATE batches SET heartbeat = ? WHERE batch = ?", (time(), batch)
+                ).rowcount
+                rows = self.conn.execute(
+                    "SELECT status, result, error FROM jobs WHERE batch = ? ORDER BY id", (batch,)
+                ).fetchall()
+            if not alive:                                                      # Expired while this driver was stalled, or finished by another driver
+                batch = self.submit(payloads)                                  # asking for the same evaluations
+                continue
+            failed = [r[2] for r in rows if r[0] == "failed"]
+            if failed:
+                self._delete(batch)
+                raise EvalQueueError(f"{len(failed)} evaluations failed, first error: {failed[0]}")
+            if all(r[0] == "done" for r in rows):
+                break
+            sleep(poll_)
+
+        self._delete(batch)
+        return [pickle.loads(r[1]) for r in rows]
+
+    def _delete(self, batch):
+        with _transaction(self.conn):
+            self.conn.execute("DELETE FROM jobs WHERE batch = ?", (batch,))
+            self.conn.execute("DELETE FROM batches WHERE batch = ?", (batch,))
+
+    def status(self):                                                          # Number of jobs in each state
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+def _heartbeat_loop(queue, job_id, worker, stop, interval):                    # Runs in its own thread with its own connection
+    conn = queue._connect()
+    while not stop.wait(interval):
+        try:
+            if not queue.heartbeat(job_id, worker, conn):
+                break
+        except sqlite3.OperationalError:                                       # Busy or briefly unreachable database, the lease outlasts a few missed beats
+            continue
+    conn.close()
+
+
+def run_worker(path, lease_=120, poll_=5.0, idle_exit_=None):
+
+    """
+    Takes evaluations off the queue and runs them until the queue has been
+    empty for idle_exit_ seconds, or forever if idle_exit_ is None. On SIGTERM
+    (e.g. preemption by the scheduler) the current evaluation is handed back,
+    or, if it has already finished, its result is stored before the worker
+    exits.
+
+    Args:
+        path (string): Path to the queue database
+        lease_ (float, optional): Lease length in seconds, heartbeats are sent every third of it
+        poll_ (float, optional): Seconds to wait when the queue is empty
+        idle_exit_ (float, optional): Seconds of an empty queue before the worker exits
+    """
+
+    queue = EvalQueue(path, lease_=lease_)
+    worker = _worker_name()
+    current = {"job": None, "terminate": False}
+
+    def on_term(signum, frame):                                                # Runs on the main thread, possibly inside one of the queue's transactions
+        current["terminate"] = True
+        job_id = current["job"]
+        if job_id is None:                                                     # Not evaluating, the main loop stops at its next check
+            return
+        current["job"] = None
+        conn = queue._connect()                                                # The main connection may be waiting for the lock
+        try:
+            queue.release(job_id, worker, conn)
+        finally:
+            conn.close()
+        raise SystemExit(0)                                                    # Abandons the evaluation
+
+    signal.signal(signal.SIGTERM, on_term)
+
+    idle_since = time()
+    while not current["terminate"]:
+        job = queue.claim(worker)
+        if job is None:
+            if idle_exit_ is not None and time() - idle_since > idle_exit_:
+                return
+            sleep(poll_)
+            continue
+
+        job_id, payload = job
+        current["job"] = job_id
+        if current["terminate"]:                                               # SIGTERM arrived while claiming
+            queue.release(job_id, worker)
+            return
+        stop = threading.Event()
+        beat = threading.Thread(
+            target=_heartbeat_loop, args=(queue, job_id, worker, stop, lease_ / 3), daemon=True
+        )
+        beat.start()
+        try:
+            func, item = pickle.loads(payload)
+            result = func(item)
+        except Exception as e:
+            current["job"] = None                                              # A SIGTERM from here on lets the outcome be stored first
+            queue.fail(job_id, worker, repr(e))
+        else:
+            current["job"] = None
+            queue.complete(job_id, pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        finally:
+            stop.set()
+            beat.join()
+            current["job"] = None
+        idle_since = time()
+
+if __name__ == "__main__":                                                     # python evaluation_queue.py worker|status <queue.db> [idle exit seconds]
+    command, db_path = argv[1], argv[2]
+    if command == "worker":
+        run_worker(db_path, idle_exit_=float(argv[3]) if len(argv) > 3 else None)
+    elif command == "status":
+        print(EvalQueue(db_path).status())
+    else:
+        raise ValueError("Command must be either 'worker' or 'status'")
@@ -0,0 +1,330 @@
+"""
+This program instruments the evolutionary algorithm loop so that the time
+spent in each generation can be broken down into variation, dispatch of the
+evaluations to the workers, the ADDA evaluations themselves, statistics and
+the hall of fame update. The timings are exported as a Chrome/Perfetto trace
+file (open in chrome://tracing or ui.perfetto.dev) and as a summary table.
+"""
+
+import json
+import os
+import pickle
+import socket
+from collections import defaultdict
+from contextlib import contextmanager
+from time import time
+
+from deap import tools
+from deap.algorithms import varAnd
+
+
+def _worker_name():                                                            # Host and process id identify a worker under SCOOP or plain multiprocessing
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TimedEvaluate:
+
+    """
+    Wraps an evaluation function so that the worker reports when it started
+    and finished the evaluation. The instance is pickled and sent to the
+    workers by futures.map, so the wrapped function must itself be picklable.
+    """
+
+    def __init__(self, evaluate):
+        self.evaluate = evaluate
+
+    def __call__(self, individual, *args, **kwargs):
+        start = time()
+        fitness = self.evaluate(individual, *args, **kwargs)
+        return fitness, (_worker_name(), start, time())
+
+
+class EvoProfiler:
+
+    # Records per-phase and per-generation timings of an evolution run.
+
+    def __init__(self):
+        self.t0 = time()
+        self.events = []                                                       # Chrome trace events
+        self.generations = []                                                  # One dictionary of timings per generation
+        self.worker_ids = {}
+        self._current = None
+
+    def start_generation(self, gen):
+        self._current = defaultdict(float)
+        self._current["gen"] = gen
+        self._current["start"] = time()
+
+    def end_generation(self):
+        cur = self._current
+        cur["wall"] = time() - cur["start"]
+        self._add_event(f"gen {cur['gen']}", cur["start"], cur["start"] + cur["wall"], "generation")
+        self.generations.append(dict(cur))
+        self._current = None
+
+    @contextmanager
+    def phase(self, name):
+
+        """
+        Times the enclosed block and adds it to the current generation.
+
+        Args:
+            name (string): Name of the phase, e.g. "variation"
+        """
+
+        start = time()
+        try:
+            yield
+        finally:
+            end = time()
+            self._add_event(name, start, end, "phase")
+            if self._current is not None:
+                self._current[name] += end - start
+
+    def map(self, mapper, evaluate, individuals):
+
+        """
+        Evaluates the individuals with the given map function and records the
+        dispatch and return latency, the time each worker spent evaluating,
+        the worker idle time and the number of bytes pickled each way.
+
+        Args:
+            mapper (function): Map function, e.g. futures.map
+            evaluate (function): Evaluation function passed to the map
+            individuals (list): Individuals to be evaluated
+
+        Returns:
+            list: Fitness values in the same order as individuals
+        """
+
+        bytes_out = sum(len(pickle.dumps(ind, pickle.HIGHEST_PROTOCOL)) for ind in individuals)
+
+        start = time()
+        results = list(mapper(TimedEvaluate(evaluate), individuals))
+        end = time()
+
+        fitnesses = [fit for fit, _ in results]
+        timings = [timing for _, timing in results]
+        bytes_in = sum(len(pickle.dumps(fit, pickle.HIGHEST_PROTOCOL)) for fit in fitnesses)
+
+        busy = defaultdict(float)
+        for worker, w_start, w_end in timings:
+            busy[worker] += w_end - w_start
+            self._add_event("evaluate", w_start, w_end, "worker", worker)
+
+        if timings:                                                            # Time until the first evaluation started and after the last one finished
+            first = min(t[1] for t in timings)
+            last = max(t[2] for t in timings)
+            self._add_event("dispatch", start, max(first, start), "phase")
+            self._add_event("return", min(last, end), end, "phase")
+        else:
+            first, last = start, end
+
+        wall = end - start
+        cur = self._current if self._current is not None else defaultdict(float)
+        cur["dispatch"] += max(first - start, 0)
+        cur["return"] += max(end - last, 0)
+        cur["worker busy"] += sum(busy.values())
+        cur["worker idle"] += sum(max(wall - b, 0) for b in busy.values())     # Only counts workers that received at least one evaluation
+        cur["workers"] = max(cur["workers"], len(busy))
+        cur["nevals"] += len(individuals)
+        cur["bytes out"] += bytes_out
+        cur["bytes in"] += bytes_in
+
+        self.events.append(
+            {
+                "name": "bytes",
+                "ph": "C",
+                "ts": self._us(end),
+                "pid": 0,
+                "args": {"out": bytes_out, "in": bytes_in},
+            }
+        )
+
+        return fitnesses
+
+    def _us(self, t):                                                          # Trace timestamps are microseconds since the start of the run
+        return (t - self.t0) * 1e6
+
+    def _add_event(self, name, start, end, cat, worker=None):
+        if worker is None:
+            pid, tid = 0, 0
+        else:
+            pid = 1
+            if worker not in self.worker_ids:
+                self.worker_ids[worker] = len(self.worker_ids)
+            tid = self.worker_ids[worker]
+        self.events.append(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": self._us(start),
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": tid,
+            }
+        )
+
+    def write_trace(self, path):
+
+        """
+        Writes the recorded events as a Chrome/Perfetto trace file.
+
+        Args:
+            path (string): Path of the .json trace file
+        """
+
+        meta = [
+            {"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "driver"}},
+            {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "workers"}},
+        ]
+        meta += [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": worker}}
+            for worker, tid in self.worker_ids.items()
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": meta + self.events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self):
+
+        """
+        Builds a table of the timings of every generation followed by the
+        totals of each phase.
+
+        Returns:
+            string: Summary table
+        """
+
+        phases = ["variation", "dispatch", "worker busy", "return", "evaluate", "halloffame", "hook", "statistics"]
+        header = ["gen", "nevals", "wall"] + phases + ["worker idle", "bytes out", "bytes in"]
+
+        rows = []
+        for g in self.generations:
+            rows.append(
+                [str(g["gen"]), str(int(g["nevals"])), f"{g['wall']:.3f}"]
+                + [f"{g.get(p, 0.0):.3f}" for p in phases]
+                + [f"{g['worker idle']:.3f}", str(int(g["bytes out"])), str(int(g["bytes in"]))]
+            )
+
+        total_wall = sum(g["wall"] for g in self.generations)
+        rows.append(
+            ["total", str(int(sum(g["nevals"] for g in self.generations))), f"{total_wall:.3f}"]
+            + [f"{sum(g.get(p, 0.0) for g in self.generations):.3f}" for p in phases]
+            + [
+                f"{sum(g['worker idle'] for g in self.generations):.3f}",
+                str(int(sum(g["bytes out"] for g in self.generations))),
+                str(int(sum(g["bytes in"] for g in self.generations))),
+            ]
+        )
+
+        widths = [max(len(r[i]) for r in rows + [header]) for i in range(len(header))]
+        lines = ["  ".join(h.rjust(w) for h, w in zip(header, widths))]
+        lines += ["  ".join(c.rjust(w) for c, w in zip(r, widths)) for r in rows]
+        return "\n".join(lines)
+
+
+def eaSimpleProfiled(
+    population,
+    toolbox,
+    cxpb,
+    mutpb,
+    ngen,
+    stats=None,
+    halloffame=None,
+    verbose=__debug__,
+    profiler=None,
+    logbook=None,
+    start_gen=0,
+    record_=None,
+    generation_hook=None,
+    precision=None,
+    screen=None,
+):
+
+    """
+    Same algorithm as deap.algorithms.eaSimple, with every phase of each
+    generation timed by an EvoProfiler. Times are in seconds.
+
+    Args:
+        population (list): A list of individuals
+        toolbox : A Toolbox that contains the evolution operators
+        cxpb (float): The probability of mating two individuals
+        mutpb (float): The probability of mutating an individual
+        ngen (int): The number of generations
+        stats (optional): A Statistics object that is updated inplace
+        halloffame (optional): A HallOfFame object that will contain the best individuals
+        verbose (bool, optional): Whether or not to log the statistics on the screen
+        profiler (EvoProfiler, optional): Profiler to record into. A new one is made if not given.
+        logbook (optional): Logbook to append to, e.g. from an earlier stage. A new one is made if not given.
+        start_gen (int, optional): Number of the first generation in the logbook and profiler
+        record_ (dict, optional): Extra fields added to every logbook record
+        generation_hook (function, optional): Called as generation_hook(gen, population, halloffame, toolbox, profiler)
+            after the hall of fame update of every generation, e.g. for local search. If it returns
+            a number of evaluations, it is added to nevals.
+        precision (AdaptivePrecision, optional): Evaluates at a scheduled solver tolerance, which is
+            added to the logbook as eps. By default every evaluation uses ADDA's default tolerance.
+        screen (FourierPrescreen, optional): Only the offspring it keeps are evaluated, the rest get
+            its estimate. nevals then counts the evaluated offspring only.
+
+    Returns:
+        tuple: Final population, logbook and the profiler
+    """
+
+    if profiler is None:
+        profiler = EvoProfiler()
+
+    if logbook is None:
+        logbook = tools.Logbook()
+        logbook.header = list(record_ or {}) + ["gen", "nevals"] + (["eps"] if precision else []) + (stats.fields if stats else [])
+
+    for gen in range(ngen + 1):
+        profiler.start_generation(start_gen + gen)
+
+        if gen == 0:
+            offspring = population
+        else:
+            with profiler.phase("variation"):
+                offspring = toolbox.select(population, len(population))
+                offspring = varAnd(offspring, toolbox, cxpb, mutpb)
+
+        with profiler.phase("evaluate"):                                       # Includes dispatch, worker time and return
+            invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
+            screened = []
+            if screen is not None:
+                invalid_ind, screened = screen.split(invalid_ind)
+            if precision is None:
+                fitnesses = profiler.map(toolbox.map, toolbox.evaluate, invalid_ind)
+                for ind, fit in zip(invalid_ind, fitnesses):
+                    ind.fitness.values = fit
+                nevals = len(invalid_ind)
+            else:
+                screened_ids = {id(ind) for ind, _ in screened}                # Screened out individuals have no fitness yet
+                evaluated = [ind for ind in offspring if id(ind) not in screened_ids]
+                nevals = precision.evaluate(start_gen + gen, evaluated, invalid_ind, halloffame, toolbox, profiler)
+            if screened:
+                screen.fill(invalid_ind, screened)
+
+        if halloffame is not None:
+            with profiler.phase("halloffame"):
+                halloffame.update(offspring)
+
+        population[:] = offspring
+
+        if generation_hook is not None:
+            with profiler.phase("hook"):
+                hook_evals = generation_hook(start_gen + gen, population, halloffame, toolbox, profiler)
+            nevals += hook_evals or 0
+
+        with profiler.phase("statistics"):
+            record = stats.compile(population) if stats else {}
+            if precision is not None:
+                record["eps"] = precision.eps_for(start_gen + gen)
+            logbook.record(**(record_ or {}), gen=start_gen + gen, nevals=nevals, **record)
+
+        profiler.end_generation()
+
+        if verbose:
+            print(logbook.stream)
+
+    return population, logbook, profiler
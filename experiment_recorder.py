@@ -41,6 +41,11 @@ class ExpRecord:
         mut_param,
         sel_meth,
         sel_param,
+        seeds=None,
+        solver_eps=None,
+        lineage=None,
+        lam_frac=None,
+        tile_factor=None,
     ):                                                                         # Add details to the table from an optimisation run
         grid_size = len(grid)
         red_date = datetime.today().strftime("%d-%m")
@@ -78,9 +83,61 @@ class ExpRecord:
             "Selection Parameter": sel_param,
             "Grid File Name": grid_file_name,
             "Log File name": log_file_name,
+            "Seed Grids": ";".join(seeds) if seeds else "",                    # Archived grids the initial population was seeded from
+            "Best Lineage": lineage or "",                                     # Archived grid the best individual descends from, empty if a random one
+            "Lambda Factor": lam_frac,                                         # With the tile factor, sets the physical size of the sail and its period
+            "Tile Factor": tile_factor,
+            "Solver Eps": solver_eps,                                          # ADDA -eps the force was solved to, empty for ADDA's default
         }
 
-        self.data_frame = self.data_frame.append(row_to_add, ignore_index=True)
+        self.data_frame = pd.concat(                                           # DataFrame.append was removed in pandas 2.0
+            [self.data_frame, pd.DataFrame([row_to_add])], ignore_index=True
+        )
+
+    def best_grids(self, n, grid_size_=None, lam_frac_=None, tile_factor_=None):
+
+        """
+        Loads the best archived designs, for seeding a new run. Designs from
+        runs with a different lambda factor or tile factor are skipped, as they
+        describe a sail of another size or period. Runs recorded before these
+        were stored come after the matching ones. Within that, grids of
+        grid_size_ come first, then other sizes, each ordered by force. Half
+        grids from the symmetric runs are skipped.
+
+        Args:
+            n (int): Number of designs to return
+            grid_size_ (int, optional): Preferred grid size
+            lam_frac_ (float, optional): Lambda factor of the new run
+            tile_factor_ (int, optional): Tile factor of the new run
+
+        Returns:
+            list: (grid, grid file name) pairs
+        """
+
+        records = self.data_frame.dropna(subset=["Force", "Grid File Name"])
+        unknown = pd.Series(False, index=records.index)
+        for column, value in (("Lambda Factor", lam_frac_), ("Tile Factor", tile_factor_)):
+            if value is None:
+                continue
+            recorded = pd.to_numeric(records[column], errors="coerce") if column in records else pd.Series(np.nan, index=records.index)
+            known = recorded.notna()                                           # Missing for runs recorded before the column was added
+            keep = ~known | np.isclose(recorded, value)
+            records, unknown = records[keep], (unknown | ~known)[keep]
+        records = records.assign(unknown=unknown, other_size=records["Grid Size"] != grid_size_)
+        records = records.sort_values(["unknown", "other_size", "Force"], ascending=[True, True, False])
+
+        seeds = []
+        for name in records["Grid File Name"]:
+            if len(seeds) == n:
+                break
+            try:
+                with open(self.directory_path + name, "rb") as f:
+                    grid = np.load(f)
+            except OSError:                                                    # Grid files may have been moved or deleted
+                continue
+            if grid.ndim == 2 and grid.shape[0] == grid.shape[1]:
+                seeds.append((grid, name))
+        return seeds
 
     def __repr__(self):
         return repr(self.data_frame)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This program stands in for the ADDA executable so that the evolutionary
+algorithm and the benchmarks can be run without ADDA or a cluster. It accepts
+the same command line as run_adda_force, reads the shape file, waits for a
+configurable delay to imitate the solver and writes CrossSec-X and CrossSec-Y
+files in the same layout as ADDA, so read_force can parse them.
+
+The delay is set with the environment variables FAKE_ADDA_DELAY (seconds per
+run) and FAKE_ADDA_DELAY_PER_DIPOLE (seconds per dipole). It is scaled by
+-eps / 5, since the number of solver iterations grows roughly linearly with
+the tolerance exponent, and a relative error of about 10^-eps is added to the
+cross sections. To use it, put an executable called "adda" that runs this
+file on the PATH, e.g.
+
+    ln -s /path/to/fake_adda.py ~/bin/adda
+"""
+
+import os
+import sys
+from time import sleep
+
+import numpy as np
+
+
+def parse_args(argv):
+
+    """
+    Picks out the options used by run_adda_force from an ADDA command line.
+    Unknown options are ignored.
+
+    Args:
+        argv (list): Command line arguments, without the program name
+
+    Returns:
+        dict: Option name (without the dash) to list of its values
+    """
+
+    options = {}
+    key = None
+    for arg in argv:
+        if arg.startswith("-") and not _is_number(arg):
+            key = arg[1:]
+            options[key] = []
+        elif key is not None:
+            options[key].append(arg)
+    return options
+
+
+def _is_number(text):
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+
+def read_shape(shape_file):                                                    # Returns the dipole coordinates as an (n, 3) integer array
+    with open(shape_file, "r") as f:
+        coords = np.array(f.read().split(), dtype=int)
+    return coords.reshape(-1, 3)
+
+
+def fake_cross_sections(coords, wavelength, dipole_per_lambda):
+
+    """
+    Makes up radiation pressure cross sections that depend on the shape in a
+    plausible way: proportional to the occupied area, increased by the amount
+    of edge in the grid and tilted sideways by any left/right or up/down
+    imbalance.
+
+    Args:
+        coords (numpy array): Dipole coordinates from the shape file
+        wavelength (float): Wavelength of incoming radiation
+        dipole_per_lambda (float): Dipoles per wavelength
+
+    Returns:
+        tuple: Cpr vectors for X and Y polarised light
+    """
+
+    if len(coords) == 0:
+        return (0.0, 0.0, 0.0), (0.0, 0.0, 0.0)
+
+    d = wavelength / dipole_per_lambda                                         # Dipole size
+    cells = np.unique(coords[:, :2], axis=0)
+    nx, ny = cells.max(axis=0) + 1
+    grid = np.zeros((nx, ny), dtype=bool)
+    grid[cells[:, 0], cells[:, 1]] = True
+
+    area = grid.sum() * d**2
+    edges = np.count_nonzero(np.diff(grid, axis=0)) + np.count_nonzero(np.diff(grid, axis=1))
+    edge_frac = edges / (2 * grid.size)
+    x_bias = grid[: nx // 2].sum() - grid[nx // 2 :].sum()
+    y_bias = grid[:, : ny // 2].sum() - grid[:, ny // 2 :].sum()
+
+    c_z = area * (1 + edge_frac)
+    c_x = area * 0.1 * x_bias / grid.size
+    c_y = area * 0.1 * y_bias / grid.size
+
+    return (c_x, c_y, c_z), (c_y, c_x, c_z)
+
+
+def write_cross_sections(results_dir, cpr):
+
+    """
+    Writes a CrossSec file in ADDA's layout, with the Cpr vector on the ninth
+    line where read_force expects it.
+
+    Args:
+        results_dir (string): Directory for the file
+        cpr (dict): Polarisation ("X" or "Y") to Cpr vector
+    """
+
+    os.makedirs(results_dir, exist_ok=True)
+    for pol, (c_x, c_y, c_z) in cpr.items():
+        c_ext = abs(c_z) * 1.2
+        with open(f"{results_dir}/CrossSec-{pol}", "w") as f:
+            print(f"Cext\t= {c_ext:.10g}", file=f)
+            print(f"Qext\t= {c_ext:.10g}", file=f)
+            print(f"Cabs\t= {c_ext / 2:.10g}", file=f)
+            print(f"Qabs\t= {c_ext / 2:.10g}", file=f)
+            print(f"Csca\t= {c_ext / 2:.10g}", file=f)
+            print(f"Qsca\t= {c_ext / 2:.10g}", file=f)
+            print("g\t= (0,0,0)", file=f)
+            print("Csca.g\t= (0,0,0)", file=f)
+            print(f"Cpr\t= ({c_x:.10g},{c_y:.10g},{c_z:.10g})", file=f)
+            print(f"Qpr\t= ({c_x:.10g},{c_y:.10g},{c_z:.10g})", file=f)
+
+
+def main(argv):
+    options = parse_args(argv)
+    try:
+        shape_file = options["shape"][1]                                       # "-shape read <file>"
+        wavelength = float(options["lambda"][0])
+        dipole_per_lambda = float(options["dpl"][0])
+        results_dir = options["dir"][0]
+    except (KeyError, IndexError, ValueError) as e:
+        print(f"fake adda: missing or bad option {e}", file=sys.stderr)
+        return 1
+
+    coords = read_shape(shape_file)
+
+    delay = float(os.environ.get("FAKE_ADDA_DELAY", 0)) + float(
+        os.environ.get("FAKE_ADDA_DELAY_PER_DIPOLE", 0)
+    ) * len(coords)
+    eps = float(options["eps"][0]) if "eps" in options else 5.0                # ADDA's default tolerance exponent
+    sleep(delay * eps / 5)
+
+    cpr_x, cpr_y = fake_cross_sections(coords, wavelength, dipole_per_lambda)
+    error = 1 + np.random.normal(0, 10**-eps)                                  # Imitates an unconverged solution
+    cpr_x = tuple(c * error for c in cpr_x)
+    cpr_y = tuple(c * error for c in cpr_y)
+    write_cross_sections(results_dir, {"X": cpr_x, "Y": cpr_y})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
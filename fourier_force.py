@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This program approximates the radiation force on a tiled sail with Fourier
+optics instead of ADDA. The tiled sail is treated as a thin periodic grating:
+each cell either transmits through free space or through a thin slab of the
+sail material, the far field is given by the diffraction orders of the tile
+(the FFT of the tile), and the force is the momentum of the incident light
+minus the momentum carried away by the propagating reflected and transmitted
+orders. It runs in milliseconds, so it can rank early generation designs or
+be used as a cheap fitness on its own.
+
+calculate_force_on_sample here takes the same arguments as the one in
+addaSeq_force_scoop, plus the tile factor, and returns a value on roughly the
+same scale.
+"""
+
+import math
+import os
+from sys import argv
+
+import numpy as np
+import pandas as pd
+
+from addaSeq_force_scoop import IM_REF_INDEX, LAYERS, REAL_REF_INDEX, WAVELENGTH
+
+REF_INDEX = complex(REAL_REF_INDEX, IM_REF_INDEX)
+
+
+def slab_coefficients(ref_index, thickness, wavelength):
+
+    """
+    Reflection and transmission amplitudes of a thin slab at normal incidence
+    (Airy formulae).
+
+    Args:
+        ref_index (complex): Refractive index of the slab
+        thickness (float): Thickness of the slab, same units as wavelength
+        wavelength (float): Wavelength of the light
+
+    Returns:
+        tuple: Complex reflection and transmission amplitudes
+    """
+
+    r12 = (1 - ref_index) / (1 + ref_index)
+    phase = np.exp(2j * math.pi * ref_index * thickness / wavelength)
+    denom = 1 - r12**2 * phase**2
+    r = r12 * (1 - phase**2) / denom
+    t = (1 - r12**2) * phase / denom
+    return r, t
+
+
+def diffraction_orders(tile, lam_over_period, thickness_frac):
+
+    """
+    Calculates the direction and efficiency of every propagating reflected
+    and transmitted diffraction order of a periodic grating.
+
+    Args:
+        tile (numpy 2d array): One period of the grating, True where there is material
+        lam_over_period (float): Wavelength divided by the grating period
+        thickness_frac (float): Thickness of the material in wavelengths
+
+    Returns:
+        tuple: Direction cosines (sx, sy, cz) of the propagating orders and the
+               efficiencies of the reflected and transmitted orders
+    """
+
+    n = len(tile)
+    r_m, t_m = slab_coefficients(REF_INDEX, thickness_frac, 1)
+    t_0 = np.exp(2j * math.pi * thickness_frac)                                # Free space over the same thickness
+
+    reflected = np.fft.fft2(np.where(tile, r_m, 0)) / tile.size                # Amplitude of each diffraction order
+    transmitted = np.fft.fft2(np.where(tile, t_m, t_0)) / tile.size
+
+    p = np.fft.fftfreq(n, 1 / n)
+    q = np.fft.fftfreq(tile.shape[1], 1 / tile.shape[1])
+    sx, sy = np.meshgrid(p * lam_over_period, q * lam_over_period, indexing="ij")
+    prop = sx**2 + sy**2 < 1                                                   # Evanescent orders carry no power away
+    cz = np.sqrt(1 - sx[prop] ** 2 - sy[prop] ** 2)
+
+    eff_r = np.abs(reflected[prop]) ** 2 * cz                                  # Power through the plane of the sail
+    eff_t = np.abs(transmitted[prop]) ** 2 * cz
+
+    return (sx[prop], sy[prop], cz), eff_r, eff_t
+
+
+def pressure_efficiency(tile, lam_over_period, thickness_frac):
+
+    """
+    Force on the grating per unit incident power (times c), as a vector.
+    """
+
+    (sx, sy, cz), eff_r, eff_t = diffraction_orders(tile, lam_over_period, thickness_frac)
+    q_x = -np.sum((eff_r + eff_t) * sx)                                        # An order carries momentum efficiency times its direction s,
+    q_y = -np.sum((eff_r + eff_t) * sy)                                        # as efficiency is power through the sail's plane, i.e. |amp|^2 cz
+    q_z = 1 + np.sum(eff_r * cz) - np.sum(eff_t * cz)
+    return q_x, q_y, q_z
+
+
+def calculate_force_on_sample(
+    shape_arr,
+    lam_frac_,
+    working_directory_=None,
+    del_files_=True,
+    scoop_=False,
+    tile_factor_=1,
+    eps_=None,
+    max_iter_=None,
+):
+
+    """
+    Approximates the force on a given numpy 2d grid of dipoles with Fourier
+    optics. The arguments match addaSeq_force_scoop.calculate_force_on_sample.
+
+    Args:
+        shape_arr (numpy 2d array): Grid of dipoles representing the (tiled) shape
+        lam_frac_ (float): The grid is 1/lam_frac_ wavelengths wide
+        working_directory_ (str, optional): Unused, no files are written
+        del_files_ (bool, optional): Unused
+        scoop_ (bool, optional): Unused
+        eps_ (float, optional): Unused, there is no iterative solver
+        max_iter_ (int, optional): Unused
+        tile_factor_ (int, optional): Number of times the tile is repeated along each side of shape_arr.
+            Leaving it at 1 gives the same orders from the whole grid, just more slowly.
+
+    Returns:
+        tuple : Approximate radiation force produced, in a single value tuple for DEAP
+    """
+
+    size = len(shape_arr)
+    dipole_per_lambda = lam_frac_ * size
+    period = size // tile_factor_
+    tile = np.asarray(shape_arr[:period, :period], dtype=bool)
+
+    lam_over_period = dipole_per_lambda / period
+    thickness_frac = LAYERS / dipole_per_lambda
+    q_x, q_y, q_z = pressure_efficiency(tile, lam_over_period, thickness_frac)
+
+    area = (WAVELENGTH / lam_frac_) ** 2                                       # Area of the sail
+    c_pr = np.array([q_x, q_y, q_z]) * area
+    force = 2 * c_pr / 8 * math.pi                                             # Both polarisations, combined as in read_force
+
+    return (float(np.sqrt(np.sum(force**2))),)
+
+
+class FourierPrescreen:
+
+    # Ranks offspring with the Fourier approximation so that only the best fraction is solved with ADDA.
+
+    def __init__(self, lam_frac_, tile_factor_, keep_=0.5):
+
+        """
+        Args:
+            lam_frac_ (float): As in calculate_force_on_sample
+            tile_factor_ (int): Number of tiles along each side of the sail
+            keep_ (float, optional): Fraction of the individuals passed on to ADDA
+        """
+
+        self.lam_frac = lam_frac_
+        self.tile_factor = tile_factor_
+        self.keep = keep_
+
+    def estimate(self, ind):
+        tiled = np.tile(ind, (self.tile_factor, self.tile_factor))
+        return calculate_force_on_sample(tiled, self.lam_frac, tile_factor_=self.tile_factor)[0]
+
+    def split(self, individuals):
+
+        """
+        Splits the individuals into those to be solved with ADDA and those
+        screened out.
+
+        Args:
+            individuals (list): Untiled grids without a fitness
+
+        Returns:
+            tuple: The kept individuals, best first, and (individual, ratio) for each
+                   screened out one, where ratio is its Fourier force over that of the
+                   worst kept individual
+        """
+
+        if not individuals:
+            return [], []
+        forces = [self.estimate(ind) for ind in individuals]
+        order = np.argsort(forces)[::-1]
+        n_keep = max(1, int(round(self.keep * len(individuals))))
+        ref = forces[order[n_keep - 1]]
+        kept = [individuals[i] for i in order[:n_keep]]
+        for ind in kept:                                                       # Clones keep their parent's flag until solved with ADDA
+            ind.fourier_estimate = False
+        screened = [(individuals[i], forces[i] / ref if ref > 0 else 1.0) for i in order[n_keep:]]
+        return kept, screened
+
+    def fill(self, kept, screened):
+
+        """
+        Gives the screened out individuals a fitness once the kept ones have
+        been solved: the lowest ADDA force of the kept individuals scaled by
+        their ratio. They keep their Fourier ranking and stay below every
+        individual solved with ADDA, so none of them can enter the hall of fame.
+        They are marked with fourier_estimate and no solver_eps, so that
+        AdaptivePrecision solves them with ADDA if they become elites.
+
+        Args:
+            kept (list): Individuals solved with ADDA
+            screened (list): (individual, ratio) from split
+        """
+
+        if not screened:
+            return
+        floor = min(ind.fitness.values[0] for ind in kept)
+        for ind, ratio in screened:
+            ind.fitness.values = (floor * ratio,)
+            ind.solver_eps = None
+            ind.fourier_estimate = True
+
+
+def calibration_report(path_to_records, lam_frac_, tile_factor_, grid_size_=None):
+
+    """
+    Compares the Fourier approximation with the ADDA forces of the archived
+    grids in ExperimentData.csv. Each grid is evaluated with the lambda and
+    tile factors stored with its run. Older records do not have them, and
+    the given values are used instead.
+
+    Args:
+        path_to_records (string): Directory containing ExperimentData.csv and the grid files
+        lam_frac_ (float): lam_frac_ for records that do not store it
+        tile_factor_ (int): Tile factor for records that do not store it
+        grid_size_ (int, optional): Only use records of this grid size
+
+    Returns:
+        tuple: Table of ADDA and approximate forces, and their Spearman rank correlation
+    """
+
+    records = pd.read_csv(os.path.join(path_to_records, "ExperimentData.csv"))
+    if grid_size_ is not None:
+        records = records[records["Grid Size"] == grid_size_]
+
+    rows = []
+    for _, record in records.iterrows():
+        with open(os.path.join(path_to_records, record["Grid File Name"]), "rb") as f:
+            grid = np.load(f)
+        if grid.ndim != 2 or grid.shape[0] != grid.shape[1]:                   # Half grids from the symmetric runs are skipped
+            continue
+        lam_frac = record.get("Lambda Factor")
+        lam_frac = lam_frac_ if pd.isna(lam_frac) else float(lam_frac)
+        tile_factor = record.get("Tile Factor")
+        tile_factor = tile_factor_ if pd.isna(tile_factor) else int(tile_factor)
+        tiled = np.tile(grid, (tile_factor, tile_factor))
+        rows.append(
+            {
+                "Grid File Name": record["Grid File Name"],
+                "Grid Size": len(grid),
+                "Lambda Factor": lam_frac,
+                "Tile Factor": tile_factor,
+                "ADDA Force": record["Force"],
+                "Fourier Force": calculate_force_on_sample(tiled, lam_frac, tile_factor_=tile_factor)[0],
+            }
+        )
+
+    table = pd.DataFrame(
+        rows, columns=["Grid File Name", "Grid Size", "Lambda Factor", "Tile Factor", "ADDA Force", "Fourier Force"]
+    )
+    rank_corr = table["ADDA Force"].rank().corr(table["Fourier Force"].rank())  # Spearman correlation without needing scipy
+    return table, rank_corr
+
+
+if __name__ == "__main__":                                                     # python fourier_force.py <records dir> <default lam_frac> <default tile factor> [grid size]
+    path, lam_frac, tile_factor = argv[1], float(argv[2]), int(argv[3])
+    grid_size = int(argv[4]) if len(argv) > 4 else None
+    table, rank_corr = calibration_report(path, lam_frac, tile_factor, grid_size)
+    print(table.to_string(index=False))
+    print(f"\nSpearman rank correlation with ADDA over {len(table)} grids: {rank_corr:.3f}")
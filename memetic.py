@@ -0,0 +1,155 @@
+"""
+This program adds a memetic local search to the evolutionary algorithm. Every
+few generations the best individuals are refined by flipping single cells
+(or small blocks of cells) and keeping the best flip if it increases the
+force. The flips for all the elites are evaluated together in one map call,
+so they spread over the same workers as the rest of the evaluations.
+"""
+
+from functools import partial
+
+import numpy as np
+from deap import tools
+
+
+def flip_candidates(ind, n, block_=1, rank_=True):
+
+    """
+    Chooses which blocks of an individual to flip.
+
+    Args:
+        ind (numpy 2d array): Individual grid
+        n (int): Number of blocks to choose
+        block_ (int, optional): Length / width of the block. Defaults to single cells.
+        rank_ (bool, optional): Prefer blocks on the edge of the material, where a flip
+            changes the shape most, instead of choosing them uniformly. Defaults to True.
+
+    Returns:
+        list: (row, column) of the top left corner of each block
+    """
+
+    size = len(ind) - block_ + 1
+    n = min(n, size * size)
+
+    if rank_:
+        grid = np.asarray(ind, dtype=bool)
+        edges = sum(                                                           # Neighbours that differ from each cell, wrapped since the grid is tiled
+            (grid != np.roll(grid, shift, axis)).astype(int) for shift in (-1, 1) for axis in (0, 1)
+        )[:size, :size]
+        score = edges + np.random.rand(size, size)                             # Random tie-breaking
+        flat = np.argsort(score, axis=None)[::-1][:n]
+    else:
+        flat = np.random.choice(size * size, n, replace=False)
+
+    return [divmod(int(k), size) for k in flat]
+
+
+def flip_block(toolbox, ind, row, col, block_):                               # Returns a copy of ind with one block flipped and no fitness
+    new_ind = toolbox.clone(ind)
+    block = new_ind[row : row + block_, col : col + block_]
+    block[...] = np.logical_not(block)
+    del new_ind.fitness.values
+    return new_ind
+
+
+class MemeticRefinement:
+
+    """
+    Generation hook for eaSimpleProfiled that refines the elites by greedy
+    local search and puts the improved individuals back into the population
+    in place of the worst ones.
+    """
+
+    def __init__(self, every_, batch_, n_elites_=1, block_=1, rounds_=1, rank_=True, precision_=None):
+
+        """
+        Args:
+            every_ (int): Refine every this many generations
+            batch_ (int): Flips evaluated per round, shared between the elites. Set it to the
+                number of workers so that each round fills them.
+            n_elites_ (int, optional): Number of elites to refine
+            block_ (int, optional): Length / width of the flipped blocks
+            rounds_ (int, optional): Greedy steps per refinement
+            rank_ (bool, optional): Rank the flips by edge cells, see flip_candidates
+            precision_ (AdaptivePrecision, optional): Flips are then solved at its full tolerance,
+                the same as the elites they are compared against
+        """
+
+        self.every = every_
+        self.batch = batch_
+        self.n_elites = n_elites_
+        self.block = block_
+        self.rounds = rounds_
+        self.rank = rank_
+        self.precision = precision_
+
+    def elites(self, population, halloffame):                                  # Hall of fame entries followed by the best of the population, without duplicates
+        candidates = list(halloffame or []) + tools.selBest(population, self.n_elites)
+        elites = []
+        for ind in candidates:
+            if len(elites) == self.n_elites:
+                break
+            if len(ind) == len(population[0]) and not any(np.array_equal(ind, e) for e in elites):
+                elites.append(ind)
+        return elites
+
+    def refine(self, elites, toolbox, profiler):
+
+        """
+        Greedy local search from each elite.
+
+        Returns:
+            tuple: The improved individuals and the number of evaluations made
+        """
+
+        current = [toolbox.clone(e) for e in elites]
+        improved = [False] * len(current)
+        active = list(range(len(current)))
+        per_elite = max(1, self.batch // max(1, len(current)))
+        nevals = 0
+        evaluate = toolbox.evaluate if self.precision is None else partial(toolbox.evaluate, eps_=self.precision.full)
+
+        for _ in range(self.rounds):
+            neighbours, owners = [], []
+            for i in active:
+                for row, col in flip_candidates(current[i], per_elite, self.block, self.rank):
+                    neighbours.append(flip_block(toolbox, current[i], row, col, self.block))
+                    owners.append(i)
+            if not neighbours:
+                break
+
+            fitnesses = profiler.map(toolbox.map, evaluate, neighbours)
+            for ind, fit in zip(neighbours, fitnesses):
+                ind.fitness.values = fit
+                ind.fourier_estimate = False                                   # Cloned from the elite, but solved with ADDA now
+                if self.precision is not None:
+                    ind.solver_eps = self.precision.full
+            nevals += len(neighbours)
+
+            still_active = []
+            for i in active:
+                best = max((n for n, o in zip(neighbours, owners) if o == i), key=lambda n: n.fitness)
+                if best.fitness > current[i].fitness:                          # Greedy acceptance, stops when no flip helps
+                    current[i] = best
+                    improved[i] = True
+                    still_active.append(i)
+            active = still_active
+            if not active:
+                break
+
+        return [ind for ind, imp in zip(current, improved) if imp], nevals
+
+    def __call__(self, gen, population, halloffame, toolbox, profiler):        # Returns the number of evaluations made, for the logbook
+        if gen == 0 or gen % self.every:
+            return 0
+
+        improved, nevals = self.refine(self.elites(population, halloffame), toolbox, profiler)
+        if not improved:
+            return nevals
+
+        worst = sorted(range(len(population)), key=lambda k: population[k].fitness)
+        for k, ind in zip(worst, improved):                                    # Re-injects the improved individuals in place of the worst ones
+            population[k] = ind
+        if halloffame is not None:
+            halloffame.update(improved)
+        return nevals
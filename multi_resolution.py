@@ -0,0 +1,125 @@
+"""
+This program runs the evolutionary algorithm coarse to fine. The population
+is evolved at a small grid size first, where each ADDA evaluation is cheap,
+then every individual is upsampled to the next grid size and the evolution
+carries on. The sail stays the same physical size at every stage, since
+calculate_force_on_sample fixes the grid to be 1/lam_frac_ wavelengths wide
+whatever its grid size, so lam_frac_ is left unchanged.
+"""
+
+from deap import tools
+
+from evolution_profiler import EvoProfiler, eaSimpleProfiled
+from Numpy_Deap_Tools import upsample_grid
+
+
+def upsample_population(population, factor, smooth_=False):
+
+    """
+    Upsamples every individual in a population. The new individuals have no
+    fitness, so they are evaluated again at the finer grid size.
+
+    Args:
+        population (list): Individuals to be upsampled
+        factor (int): Upsampling factor
+        smooth_ (bool, optional): Smooth the block edges, see upsample_grid
+
+    Returns:
+        list: Upsampled individuals
+    """
+
+    new_pop = []
+    for ind in population:
+        new_ind = type(ind)(upsample_grid(ind, factor, smooth_))
+        if hasattr(ind, "lineage"):
+            new_ind.lineage = ind.lineage
+        new_pop.append(new_ind)
+    return new_pop
+
+
+def eaMultiResolution(
+    population,
+    toolbox,
+    stages,
+    cxpb,
+    mutpb,
+    stats=None,
+    halloffame=None,
+    verbose=__debug__,
+    profiler=None,
+    smooth_=False,
+    generation_hook=None,
+    precision=None,
+    screen=None,
+):
+
+    """
+    Runs eaSimpleProfiled at each grid size of the stage schedule in turn,
+    upsampling the population between stages. The logbook covers all stages,
+    with the stage number and grid size in every record. The hall of fame is
+    cleared at the start of each stage so it ends up holding individuals of
+    the final grid size.
+
+    Args:
+        population (list): Individuals of the first stage's grid size
+        toolbox : A Toolbox that contains the evolution operators
+        stages (list): (grid size, number of generations) for each stage, coarse to fine.
+            Each grid size must be a multiple of the one before.
+        cxpb (float): The probability of mating two individuals
+        mutpb (float): The probability of mutating an individual
+        stats (optional): A Statistics object that is updated inplace
+        halloffame (optional): A HallOfFame object that will contain the best individuals
+        verbose (bool, optional): Whether or not to log the statistics on the screen
+        profiler (EvoProfiler, optional): Profiler to record into
+        smooth_ (bool, optional): Smooth the upsampled grids. Defaults to nearest-neighbour.
+        generation_hook (function, optional): Passed on to eaSimpleProfiled
+        precision (AdaptivePrecision, optional): Passed on to eaSimpleProfiled
+        screen (FourierPrescreen, optional): Passed on to eaSimpleProfiled
+
+    Raises:
+        ValueError: If the population or a stage does not fit the schedule
+
+    Returns:
+        tuple: Final population, logbook and the profiler
+    """
+
+    if profiler is None:
+        profiler = EvoProfiler()
+
+    if len(population[0]) != stages[0][0]:
+        raise ValueError("The population must have the grid size of the first stage")
+
+    logbook = tools.Logbook()
+    logbook.header = ["stage", "grid", "gen", "nevals"] + (["eps"] if precision else []) + (stats.fields if stats else [])
+    start_gen = 0
+
+    for stage, (grid_size, ngen) in enumerate(stages):
+        if stage > 0:
+            prev_size = stages[stage - 1][0]
+            if grid_size % prev_size:
+                raise ValueError(f"Grid size {grid_size} is not a multiple of {prev_size}")
+            population = upsample_population(population, grid_size // prev_size, smooth_)
+
+        if halloffame is not None:
+            halloffame.clear()
+
+        population, logbook, profiler = eaSimpleProfiled(
+            population,
+            toolbox,
+            cxpb,
+            mutpb,
+            ngen,
+            stats=stats,
+            halloffame=halloffame,
+            verbose=verbose,
+            profiler=profiler,
+            logbook=logbook,
+            start_gen=start_gen,
+            record_={"stage": stage, "grid": grid_size},
+            generation_hook=generation_hook,
+            precision=precision,
+            screen=screen,
+        )
+        start_gen += ngen + 1
+
+    return population, logbook, profiler